@@ -1,3 +1,3 @@
 # coding: utf-8
 
-from .markdownviewer import run, main
+from .markdownviewer import run, main, Renderer
@@ -0,0 +1,67 @@
+"""
+The escape sequences in rendered text: colors as built by to_col (SGR: 0,
+1, 38;5;n, 38;2;r;g;b, 0;48;2;r;g;b, ...) and cursor moves (add_bg_reset),
+in one precompiled scanner.
+
+- strip(s): s without them
+- width(s): the visible width in terminal columns (see widths), memoized
+  (table cells, hr lines and the like are measured repeatedly)
+- slice(s, start, end): the visible columns start to end of s, with the
+  colors in effect there: the ones set before start repeated, a reset
+  appended when any is open
+"""
+import re
+from functools import lru_cache
+
+from .widths import clip, columns
+
+# any CSI sequence (colors end with m):
+csi = r'\x1b\[[0-9;?]*[A-Za-z]'
+csi_re, split_re = re.compile(csi), re.compile('(%s)' % csi)
+reset = '\x1b[0m'
+# resets to the terminal's colors:
+plain = (reset, '\x1b[m')
+
+
+def strip(s):
+    return csi_re.sub('', s) if '\x1b' in s else s
+
+
+@lru_cache(maxsize=8192)
+def width(s):
+    return columns(strip(s)) if '\x1b' in s else columns(s)
+
+
+def is_reset(seq):
+    # '\x1b[0;48;2;...m' too (reset, then the background):
+    return seq in plain or seq.startswith('\x1b[0;')
+
+
+def slice(s, start=0, end=None):
+    """The visible columns [start:end] of s, colors kept"""
+    if '\x1b' not in s:
+        return clip(s, start, end)
+    out, state, col = [], [], 0
+    for i, part in enumerate(split_re.split(s)):
+        if not i % 2:
+            # text:
+            n = columns(part)
+            if col + n > start and (end is None or col < end):
+                if not out:
+                    out.extend(state)
+                out.append(clip(part, max(start - col, 0), None if end is None else end - col))
+            col += n
+        elif end is not None and col >= end:
+            break
+        elif col < start:
+            if part[-1] == 'm':
+                state = [part] if is_reset(part) else state + [part]
+        else:
+            if not out:
+                out.extend(state)
+            out.append(part)
+    # still colored:
+    last = [p for p in out if p[:2] == '\x1b[' and p[-1] == 'm'][-1:]
+    if last and last[0] not in plain:
+        out.append(reset)
+    return ''.join(out)
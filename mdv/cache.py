@@ -0,0 +1,35 @@
+"""
+Where mdv keeps derived data, e.g. the theme pack.
+
+Location: `$MDV_CACHE_DIR`, else `$XDG_CACHE_HOME/mdv`, else `~/.cache/mdv`.
+Everything in there can be deleted any time, it is rebuilt on demand.
+"""
+import os
+
+envget = os.environ.get
+
+
+def cache_dir():
+    d = envget('MDV_CACHE_DIR')
+    if not d:
+        d = envget('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        d = os.path.join(d, 'mdv')
+    return d
+
+
+def write_atomic(fn, s):
+    """Readers (other mdv processes) see either the old or the new file.
+    Returns False if we can't write (read only home, ...)"""
+    tmp = '%s.%s.tmp' % (fn, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
+        with open(tmp, 'wb' if isinstance(s, bytes) else 'w') as fd:
+            fd.write(s)
+        os.replace(tmp, fn)
+        return True
+    except (IOError, OSError):
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        return False
@@ -0,0 +1,202 @@
+"""
+Render daemon: Keeps a warm mdv (markdown, pygments and its lexers, theme pack)
+resident and renders requests sent over a unix socket.
+
+    mdv -D        # start it (foreground, Ctrl-C stops)
+    mdv foo.md    # renders via the daemon if one is up, else in process
+
+Each request is rendered in a forked child of the warm server, i.e. renders
+can't leak state (style rules, link style, ...) into each other.
+
+Socket: `$MDV_SOCKET`, else `$XDG_RUNTIME_DIR/mdv.sock`, else
+`/tmp/mdv-<uid>/mdv.sock` (the directory created 0700 by the server). Set
+`$MDV_NO_DAEMON` to never use it.
+
+Documents go to it and its output to the terminal, so it is only used when
+it is ours: a socket, owned by us, no group or other permissions (within a
+directory of the same kind, for the /tmp one). Else we render in process -
+and the server refuses to start, rather than replacing it.
+
+Protocol: One json line per direction. Request: `{"kw": <main kwargs>,
+"term": [cols, rows], "env": <the client's $MDV_* vars>}`. Response:
+`{"res": <rendered>}` or `{"err": <stderr output>, "exit": <code>}`.
+"""
+from __future__ import print_function
+
+import io
+import json
+import os
+import stat
+import sys
+from functools import partial
+
+envget = os.environ.get
+# these are rendered in process:
+no_daemon_keys = ('monitor_file', 'monitor_dir', 'theme_browser', 'sh_help')
+
+
+def fallback_dir():
+    return '/tmp/mdv-%s' % os.getuid()
+
+
+def socket_path():
+    p = envget('MDV_SOCKET')
+    if p:
+        return p
+    d = envget('XDG_RUNTIME_DIR')
+    if d:
+        return os.path.join(d, 'mdv.sock')
+    return os.path.join(fallback_dir(), 'mdv.sock')
+
+
+def is_private(p, is_type=stat.S_ISSOCK):
+    """p is of type is_type, owned by us and not accessible by others (not
+    followed, if a symlink)"""
+    try:
+        st = os.lstat(p)
+    except OSError:
+        return False
+    return is_type(st.st_mode) and st.st_uid == os.getuid() and not st.st_mode & 0o077
+
+
+def is_ours(p):
+    d = os.path.dirname(p)
+    if d == fallback_dir() and not is_private(d, stat.S_ISDIR):
+        return False
+    return is_private(p)
+
+
+def is_up():
+    return not envget('MDV_NO_DAEMON') and is_ours(socket_path())
+
+
+# ---------------------------------------------------------------------- Client
+def build_request(kw, term):
+    kw = dict(kw)
+    fn = kw.get('filename')
+    if not kw.get('md'):
+        if fn == '-':
+            kw['md'] = sys.stdin.read()
+        elif fn and os.path.isfile(fn):
+            with io.open(fn, encoding=kw.get('encoding', 'utf-8')) as fd:
+                kw['md'] = fd.read()
+        else:
+            # let main report it:
+            return
+    if fn and fn != '-':
+        kw['filename'] = os.path.abspath(fn)
+    env = dict((k, v) for k, v in os.environ.items() if k.startswith('MDV_'))
+    return {'kw': kw, 'term': list(term), 'env': env}
+
+
+def render(kw, term):
+    """kw: main's kwargs, term: (cols, rows).
+    Returns the rendered string or None, when the daemon can't serve it"""
+    if not is_up() or any(kw.get(k) for k in no_daemon_keys):
+        return
+    req = build_request(kw, term)
+    if not req:
+        return
+    import socket
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_path())
+        s.sendall(json.dumps(req).encode('utf-8') + b'\n')
+        with s.makefile('rb') as fd:
+            res = fd.readline()
+    except (IOError, OSError):
+        # stale socket, daemon went away:
+        return
+    finally:
+        s.close()
+    if not res:
+        return
+    res = json.loads(res.decode('utf-8'))
+    if 'err' in res:
+        sys.stderr.write(res['err'])
+        sys.exit(res['exit'])
+    return res['res']
+
+
+# ---------------------------------------------------------------------- Server
+def handle(req):
+    """runs in the forked child"""
+    from . import markdownviewer as mv
+
+    for k in [k for k in os.environ if k.startswith('MDV_')]:
+        del os.environ[k]
+    os.environ.update(req['env'])
+    mv.term_columns, mv.term_rows = req['term']
+    # a highlighting pool would be started and torn down with each request:
+    mv.hl_pool_min_cpus = None
+    err = sys.stderr = io.StringIO()
+    mv.errout = partial(print, file=err)
+    try:
+        return {'res': mv.main(**req['kw'])}
+    except SystemExit as ex:
+        return {'err': err.getvalue(), 'exit': ex.code}
+    except Exception as ex:
+        return {'err': err.getvalue() + 'mdv daemon: %r\n' % ex, 'exit': 1}
+
+
+def warm_up():
+    from . import markdownviewer as mv
+
+    mv.main(md=mv.__doc__, theme='zenburn', cols=80, keep_bg=True)
+    if mv.load_pygments():
+        # the lexers guessing may pick, their modules imported:
+        mv.guess.compile_rules()
+        for lang in mv.guess.rules:
+            mv.lexers.get(lang)
+
+
+def serve():
+    import socketserver
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            req = json.loads(self.rfile.readline().decode('utf-8'))
+            res = json.dumps(handle(req)) + '\n'
+            self.wfile.write(res.encode('utf-8'))
+
+    class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        pass
+
+    p = socket_path()
+    d = os.path.dirname(p)
+    if d == fallback_dir():
+        try:
+            os.mkdir(d, 0o700)
+        except OSError:
+            pass
+        if not is_private(d, stat.S_ISDIR):
+            sys.exit('mdv daemon: %s is not a private directory of ours' % d)
+    if os.path.lexists(p):
+        if not is_ours(p):
+            sys.exit('mdv daemon: %s exists and is not a private socket of ours' % p)
+        import socket
+
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(p)
+            sys.exit('mdv daemon already running at %s' % p)
+        except (IOError, OSError):
+            os.unlink(p)
+        finally:
+            s.close()
+    warm_up()
+    import signal
+
+    # cleanup on kill, as on Ctrl-C:
+    signal.signal(signal.SIGTERM, lambda *a: sys.exit(0))
+    os.umask(0o077)
+    server = Server(p, Handler)
+    sys.stderr.write('mdv daemon listening at %s\n' % p)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(p)
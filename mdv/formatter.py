@@ -0,0 +1,116 @@
+"""
+pygments formatter for code blocks: tokens -> ansi colored lines, written
+into one buffer.
+
+- adjacent tokens of the same color are one run (one start sequence, one
+  reset)
+- every line gets `prefix` (indent and code_pref, in Tags.code), runs
+  spanning lines are closed before and reopened after it, i.e. multiline
+  tokens (docstrings, heredocs) keep their color on every line
+- no trailing newline
+
+`fast_tokens` is the lexer for huge blocks (Renderer.large_code): one regex
+pass, strings, numbers and comments of most languages, nothing else. The end
+of a /* comment is searched with str.find, once there is none left no more:
+unclosed openers (`path/*.log`) don't rescan the rest of the block.
+
+Imported on first highlighting, like pygments.
+"""
+import io
+import re
+
+from pygments import highlight as pyg_highlight
+from pygments import token
+from pygments.formatter import Formatter
+
+# every branch starts with a char of [#/"'\d-], the regex engine skips to
+# those in C. What must not precede a token is checked after that char.
+# Numbers take dates, times and versions in one (fewer tokens):
+fast_re = re.compile(
+    r"""
+    (?P<Comment>\#(?<![\w&/]\#)[^\n]*|//(?<![\w:]//)[^\n]*)
+  | (?P<Block>/\*)
+  | (?P<String>"[^"\\\n]*(?:\\.[^"\\\n]*)*"|'[^'\\\n]*(?:\\.[^'\\\n]*)*')
+  | (?P<Number>-?\d(?<![\w.]\d)(?<![\w.]-\d)[\d.:eE+-]*)
+    """,
+    re.X | re.S,
+)
+fast_types = {
+    'Comment': token.Comment,
+    'Block': token.Comment,
+    'String': token.String,
+    'Number': token.Number,
+}
+
+
+class AnsiFormatter(Formatter):
+    """Options: sgr: token type -> escape sequence starting its color (a
+    mapping), reset: the one ending a run, prefix: of every line"""
+
+    name = 'mdv ansi'
+
+    def __init__(self, **options):
+        Formatter.__init__(self, **options)
+        self.sgr = options['sgr']
+        self.reset = options.get('reset', '\x1b[0m')
+        self.prefix = options.get('prefix', '')
+
+    def format_unencoded(self, tokensource, outfile):
+        sgr, reset, prefix = self.sgr, self.reset, self.prefix
+        toks = list(tokensource)
+        if toks and toks[-1][1].endswith('\n'):
+            # the lexer's final newline:
+            toks[-1] = (toks[-1][0], toks[-1][1][:-1])
+        # newlines within runs: close, prefix, reopen
+        nl = reset + '\n' + prefix
+        out = [prefix]
+        add = out.append
+        cur = None
+        for ttype, value in toks:
+            if not value:
+                continue
+            s = sgr[ttype]
+            if s != cur:
+                add(s if cur is None else reset + s)
+                cur = s
+            add(value.replace('\n', nl + s) if '\n' in value else value)
+        if cur is not None:
+            add(reset)
+        outfile.write(''.join(out))
+
+
+def highlight(code, lexer, **options):
+    buf = io.StringIO()
+    pyg_highlight(code, lexer, AnsiFormatter(**options), buf)
+    return buf.getvalue()
+
+
+def fast_tokens(code):
+    """(token type, value) of code, like a lexer's get_tokens, in linear time"""
+    pos, Text, types = 0, token.Text, fast_types
+    closing, search = True, fast_re.search
+    m = search(code)
+    while m:
+        start, end = m.span()
+        kind = m.lastgroup
+        if kind == 'Block':
+            e = code.find('*/', end) if closing else -1
+            if e < 0:
+                # unclosed, all later ones as well:
+                closing = False
+                m = search(code, end)
+                continue
+            end = e + 2
+        if start > pos:
+            yield Text, code[pos:start]
+        yield types[kind], code[start:end]
+        pos = end
+        m = search(code, end)
+    if pos < len(code):
+        yield Text, code[pos:]
+
+
+def format_tokens(tokens, **options):
+    buf = io.StringIO()
+    AnsiFormatter(**options).format(tokens, buf)
+    return buf.getvalue()
@@ -0,0 +1,204 @@
+"""
+Lexer guessing for code blocks without a language.
+
+pygments' guess_lexer imports every lexer module and runs all their
+analyse_text functions over the whole block - slow, and its results for
+short snippets are often off. Here, cheaply:
+
+1. a shebang line names the interpreter
+2. else the first `max_lines` lines (at most `max_chars`) are scored by the
+   keyword and punctuation rules of the common languages below.
+
+No language scoring at least `min_score`: None, i.e. the caller's default
+lexer. A full sample is scored in a few ms, `budget` only guards against
+pathological input: out of time (checked per rule) it is None as well, not
+the best of a partial scoring - and not final (see result), callers don't
+cache it.
+"""
+import re
+import time
+
+# of the rules, guesses are cached by it (hlcache):
+version = 1
+max_lines, max_chars = 40, 4000
+# seconds:
+budget = 0.05
+min_score = 3
+
+# interpreter -> alias (others: their name, if pygments knows it):
+interpreters = {
+    'sh': 'bash',
+    'zsh': 'bash',
+    'ksh': 'bash',
+    'node': 'javascript',
+    'nodejs': 'javascript',
+    'deno': 'typescript',
+    'python': 'python',
+    'pypy': 'python',
+    'ruby': 'ruby',
+    'perl': 'perl',
+    'php': 'php',
+}
+
+# language: [(weight, regex), ...], each match counts, regexes are multiline:
+rules = {
+    'python': [
+        (3, r'^\s*def \w+\(.*\)( -> .+)?:\s*$'),
+        (3, r'^\s*(from [\w.]+ import|import [\w.]+(, [\w.]+)*\s*$)'),
+        (3, r'^\s*class \w+(\(.*\))?:\s*$'),
+        (2, r'^\s*(elif .*|else|try|except.*|finally|with .* as \w+):\s*$'),
+        (1, r'\bself\.\w+|\b(None|True|False)\b|^\s*@\w+'),
+        (1, r'^\s*(print|return|raise|yield) '),
+    ],
+    'javascript': [
+        (3, r'\bfunction\s*\w*\s*\([^)]*\)\s*\{'),
+        (2, r'^\s*(const|let|var) \w+ = '),
+        (2, r'\bconsole\.\w+\(|\brequire\([\'"]|\bmodule\.exports\b'),
+        (2, r'\)\s*=>\s*\{?|\w => '),
+        (1, r'===|!==|;\s*$'),
+    ],
+    'typescript': [
+        (3, r'^\s*(export )?(interface|type|enum) \w+'),
+        (3, r'\w\??: (string|number|boolean|any|void)\b'),
+        (2, r'\): \w+(\[\])? \{'),
+    ],
+    'bash': [
+        (3, r'^\s*(if|elif|while) \[\[? .* \]\]?'),
+        (3, r'^\s*(fi|done|esac|then|do)\s*$'),
+        (2, r'^\s*(\$ )?(sudo|apt(-get)?|brew|pip3?|npm|git|cd|ls|mkdir|rm|cp|mv|'
+            r'curl|wget|echo|export|source|chmod|make|docker|set) '),
+        (1, r'"\$\{?\w+\}?"|\$\(\w|\|\s*(grep|awk|sed|xargs|sort|head|tail)\b'),
+    ],
+    'c': [
+        (3, r'^\s*#\s*(include\s*[<"]|define \w|ifn?def \w)'),
+        (2, r'^\s*(static |const |extern |unsigned )*(int|void|char|long|'
+            r'double|float|struct \w+)\s+\**\w+\s*[(;=\[]'),
+        (2, r'\b(printf|malloc|free|sizeof|NULL)\b'),
+        (1, r';\s*$|\w->\w'),
+    ],
+    'cpp': [
+        (3, r'\bstd::|#include\s*<(iostream|vector|string|map|memory)>'),
+        (3, r'^\s*(template\s*<|namespace \w+|using namespace)'),
+        (2, r'\b(cout|cerr|nullptr|auto|public:|private:)'),
+    ],
+    'java': [
+        (3, r'\b(public|private|protected) (static )?(final )?(class|void|[A-Z]\w*) \w+'),
+        (3, r'^\s*import java\w*\.|\bSystem\.(out|err)\.'),
+        (1, r'\bnew [A-Z]\w*\(|@Override\b'),
+    ],
+    'go': [
+        (4, r'^package \w+\s*$'),
+        (3, r'^func (\([^)]*\) )?\w+\('),
+        (2, r'\w :?= |\bfmt\.\w+\(|\berr != nil\b'),
+    ],
+    'rust': [
+        (3, r'^\s*(pub )?fn \w+(<[^>]*>)?\('),
+        (3, r'\blet mut \w|^\s*(use (std|crate)::|impl\b)'),
+        (2, r'\b(println|vec|format)!\(|&str\b|::new\('),
+    ],
+    'ruby': [
+        (3, r'^\s*def \w+[?!]?(\(.*\))?\s*$|^\s*end\s*$'),
+        (2, r'^\s*(puts|require|attr_accessor|module) '),
+        (2, r'\bdo \|\w+(, ?\w+)*\|'),
+        (1, r'@\w+|#\{'),
+    ],
+    'php': [(9, r'<\?php'), (1, r'\$\w+\s*=|\$\w+->\w+')],
+    'json': [
+        (3, r'^\s*\{?\s*"[^"\n]+"\s*:\s*(["\[{\d-]|true|false|null)'),
+        (1, r'^\s*[\[\]{}],?\s*$'),
+    ],
+    'yaml': [
+        (2, r'^\s*[\w-]+:(\s+[^\s#].*)?\s*$'),
+        (2, r'^\s*- [\w"\']'),
+        (3, r'^---\s*$'),
+    ],
+    'html': [
+        (4, r'<!DOCTYPE html|<(html|head|body|div|span|ul|ol|li|p|a|table|script)\b[^>]*>'),
+        (1, r'</\w+>'),
+    ],
+    'xml': [(9, r'^<\?xml '), (1, r'</[\w:.-]+>')],
+    'css': [
+        (3, r'^\s*[.#]?[\w-]+([ ,>+~:]+[.#]?[\w-]+)*\s*\{\s*$'),
+        (2, r'^\s*[\w-]+\s*:\s*[^;]+;\s*$'),
+    ],
+    'sql': [
+        (3, r'(?i)^\s*(select|insert into|update \w+ set|delete from|create (table|index|view)|'
+            r'alter table|drop table)\b'),
+        (1, r'(?i)\b(from|where|join|group by|order by|primary key|values)\b'),
+    ],
+    'diff': [(4, r'^(\+\+\+|---) \S|^@@ .* @@'), (1, r'^[+-]')],
+    'ini': [(3, r'^\[[\w. "-]+\]\s*$'), (2, r'^[\w.-]+ ?= ?')],
+    'docker': [
+        (4, r'^(FROM|RUN|CMD|COPY|ADD|ENTRYPOINT|WORKDIR|ENV|EXPOSE|ARG|LABEL) ')
+    ],
+    'make': [(2, r'^[\w.$()/-]+:( [\w.$()/-]+)*\s*$'), (3, r'^\t\S'), (1, r'\$\(\w+\)')],
+}
+# language: its base - scored only when its own rules hit, then base's score
+# added (any c++ scores as c, too):
+extends = {'cpp': 'c', 'typescript': 'javascript'}
+
+compiled = None
+shebang_re = re.compile(r'#!\s*(\S+)(\s+(-\S+\s+)*(\S+))?')
+
+
+def compile_rules():
+    global compiled
+    compiled = [(l, [(w, re.compile(r, re.M)) for w, r in rs]) for l, rs in rules.items()]
+    return compiled
+
+
+def shebang(line):
+    m = shebang_re.match(line)
+    if not m:
+        return
+    prog = m.group(1).rsplit('/', 1)[-1]
+    if prog == 'env' and m.group(4):
+        prog = m.group(4).rsplit('/', 1)[-1]
+    # python3.11 -> python
+    prog = re.match(r'[a-z]*', prog).group()
+    return interpreters.get(prog, prog) or None
+
+
+def sample(code):
+    code = code.lstrip('\n')[:max_chars]
+    lines = code.split('\n', max_lines)
+    return '\n'.join(lines[:max_lines])
+
+
+def scores(code, max_secs=None):
+    """{language: score} - the ones fully scored within max_secs (default:
+    budget)"""
+    max_secs = max_secs or budget
+    langs, t0, res = compiled or compile_rules(), time.time(), {}
+    for lang, rs in langs:
+        score = 0
+        for w, r in rs:
+            score += w * len(r.findall(code))
+            if time.time() - t0 > max_secs:
+                break
+        else:
+            res[lang] = score
+            continue
+        break
+    for lang, base in extends.items():
+        if res.get(lang):
+            res[lang] += res.get(base, 0)
+    return res
+
+
+def result(code, max_secs=None):
+    """(lexer alias for code or None, final) - (None, False) when out of time
+    before all languages were scored"""
+    code = sample(code)
+    if code.startswith('#!'):
+        return shebang(code.split('\n', 1)[0]), True
+    s = scores(code, max_secs)
+    if len(s) < len(compiled):
+        return None, False
+    lang = max(s, key=s.get) if s else None
+    return (lang if lang and s[lang] >= min_score else None), True
+
+
+def guess(code, max_secs=None):
+    """A lexer alias for code or None"""
+    return result(code, max_secs)[0]
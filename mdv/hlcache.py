@@ -0,0 +1,137 @@
+"""
+Highlighted code, content addressed: The same snippets (install commands,
+config samples, ...) are in many docs and rendered again on every monitor
+refresh - lexed once here.
+
+Keys are sha1 hex digests (see Renderer.style_ansi for what goes into them).
+Values are strings, kept
+
+- in memory: the most recently used ones, up to `mem_max` entries or
+  `mem_max_chars` characters
+- on disk: `<cache dir>/hl/<key[:2]>/<key>`, written atomically, i.e.
+  concurrent mdv processes are fine. When over `disk_max_bytes` the least
+  recently used ones are deleted, checked every `trim_every` writes and on
+  the first write of a process (at most every `trim_interval` seconds).
+  `disk_max_bytes = 0`: memory only.
+
+`stats` counts hits (from memory or disk) and misses.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .cache import cache_dir, write_atomic
+
+version = 3
+mem_max, mem_max_chars = 1000, 20 * 1000 * 1000
+disk_max_bytes = 50 * 1024 * 1024
+trim_every, trim_interval = 500, 3600
+
+mem, mem_chars = OrderedDict(), 0
+lock = threading.Lock()
+stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0}
+
+
+def key(*parts):
+    h = hashlib.sha1(str(version).encode('utf-8'))
+    for p in parts:
+        h.update(b'\0' + p.encode('utf-8'))
+    return h.hexdigest()
+
+
+def path(k):
+    return os.path.join(cache_dir(), 'hl', k[:2], k)
+
+
+def get(k):
+    """The value or None"""
+    with lock:
+        v = mem.get(k)
+        if v is not None:
+            mem.move_to_end(k)
+            stats['hits'] += 1
+            return v
+    if disk_max_bytes:
+        fn = path(k)
+        try:
+            with open(fn, 'rb') as fd:
+                v = fd.read().decode('utf-8')
+            # recently used, for trim:
+            os.utime(fn)
+        except (IOError, OSError, ValueError):
+            v = None
+    with lock:
+        if v is None:
+            stats['misses'] += 1
+            return
+        stats['hits'] += 1
+        stats['disk_hits'] += 1
+        remember(k, v)
+    return v
+
+
+def remember(k, v):
+    global mem_chars
+    mem_chars += len(v) - len(mem.pop(k, ''))
+    mem[k] = v
+    while len(mem) > mem_max or mem_chars > mem_max_chars:
+        mem_chars -= len(mem.popitem(last=False)[1])
+
+
+def put(k, v, disk=True):
+    """disk=False: memory only, for values which may be different next time"""
+    with lock:
+        remember(k, v)
+        if not disk_max_bytes or not disk:
+            return
+        stats['writes'] += 1
+        n = stats['writes']
+    if write_atomic(path(k), v.encode('utf-8')) and (n == 1 or not n % trim_every):
+        trim(force=n > 1)
+
+
+def trim(force=False):
+    """Deletes the least recently used files until we are below 80% of
+    disk_max_bytes. Other processes may delete the same, we don't care"""
+    d = os.path.join(cache_dir(), 'hl')
+    stamp = os.path.join(d, '.trimmed')
+    try:
+        if not force and time.time() - os.stat(stamp).st_mtime < trim_interval:
+            return
+    except OSError:
+        pass
+    write_atomic(stamp, '')
+    files, total = [], 0
+    for sub in os.scandir(d):
+        if not sub.is_dir():
+            continue
+        try:
+            for f in os.scandir(sub.path):
+                st = f.stat()
+                files.append((st.st_mtime, st.st_size, f.path))
+                total += st.st_size
+        except OSError:
+            pass
+    if total <= disk_max_bytes:
+        return
+    files.sort()
+    for mt, size, fn in files:
+        try:
+            os.unlink(fn)
+        except OSError:
+            pass
+        total -= size
+        if total < disk_max_bytes * 0.8:
+            break
+
+
+def clear():
+    """The memory part and the stats (tests, benchmarks)"""
+    global mem_chars
+    with lock:
+        mem.clear()
+        mem_chars = 0
+        for k in stats:
+            stats[k] = 0
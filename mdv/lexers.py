@@ -0,0 +1,149 @@
+"""
+Lexer index: fence info string -> pygments lexer, resolved once per process.
+
+pygments' get_lexer_by_name walks all lexer aliases and instantiates a new
+lexer per call - and for names it doesn't know it scans the plugin entry
+points, which is slow. Here:
+
+- alias -> (module, class) of the builtin and plugin lexers is kept on disk,
+  in the cache dir, rebuilt when the pygments version changes or a
+  distribution got installed or removed (the site-packages dirs' mtimes
+  changed), which may have brought plugin lexers.
+- Resolved lexer instances are reused per name (unknown names are
+  remembered as well).
+- File names ('Makefile') and extensions ('py') -> alias, for -C mode.
+
+Names are normalized: 'language-python' (markdown's class) -> 'python',
+lower case, plus a few aliases pygments doesn't have (`extra_aliases`).
+"""
+import io
+import json
+import os
+import re
+import site
+from importlib import import_module
+
+from .cache import cache_dir, write_atomic
+
+version = 2
+# fence names pygments does not know:
+extra_aliases = {'yml': 'yaml', 'plain': 'text'}
+aliases = filenames = None
+instances = {}
+ext_pattern = re.compile(r'^\*\.([\w+-]+)$')
+
+
+def pack_file():
+    return os.path.join(cache_dir(), 'lexers.json')
+
+
+def installed():
+    """[dir, mtime] of the site-packages dirs: what the plugin entry points
+    depend on, w/o reading them (importlib.metadata takes ~70ms)"""
+    dirs = site.getsitepackages() if hasattr(site, 'getsitepackages') else []
+    if site.ENABLE_USER_SITE:
+        dirs = dirs + [site.getusersitepackages()]
+    r = []
+    for d in dirs:
+        try:
+            r.append([d, os.stat(d).st_mtime])
+        except OSError:
+            pass
+    return r
+
+
+def build(pygments_version, dists=None):
+    from pygments.lexers._mapping import LEXERS
+    from pygments.plugin import find_plugin_lexers
+
+    m, fns = {}, {}
+    for cls_name, (mod, _, als, patterns, _) in LEXERS.items():
+        for a in als:
+            m.setdefault(a, (mod, cls_name))
+        for p in patterns if als else ():
+            ext = ext_pattern.match(p)
+            if ext:
+                # '*.sql': sql, not the first one (sql+jinja):
+                ext = ext.group(1)
+                if ext not in fns or ext in als:
+                    fns[ext] = als[0]
+            elif not set(p) & set('*?['):
+                fns.setdefault(p, als[0])
+    for cls in find_plugin_lexers():
+        for a in cls.aliases:
+            m.setdefault(a, (cls.__module__, cls.__name__))
+    for a, n in extra_aliases.items():
+        if a not in m and n in m:
+            m[a] = m[n]
+    return {
+        'version': version,
+        'pygments': pygments_version,
+        'installed': installed() if dists is None else dists,
+        'aliases': m,
+        'filenames': fns,
+    }
+
+
+def load():
+    """alias -> [module, class name]"""
+    global aliases, filenames
+    if aliases is not None:
+        return aliases
+    from pygments import __version__
+
+    pack = None
+    fn = pack_file()
+    try:
+        with io.open(fn, encoding='utf-8') as fd:
+            pack = json.loads(fd.read())
+    except (IOError, OSError, ValueError):
+        pass
+    dists = installed()
+    if (
+        not pack
+        or pack.get('version') != version
+        or pack.get('pygments') != __version__
+        or pack.get('installed') != dists
+    ):
+        pack = build(__version__, dists)
+        write_atomic(fn, json.dumps(pack, separators=(',', ':')))
+    aliases, filenames = pack['aliases'], pack['filenames']
+    return aliases
+
+
+def normalize(name):
+    # markdown lib now creates "language-python" (pygments still wants "python")
+    name = name.strip().lower()
+    if name.startswith('language-'):
+        name = name[9:]
+    return name
+
+
+def known(name):
+    """name is in the index (its lexer not imported)"""
+    return normalize(name) in load()
+
+
+def get(name):
+    """A lexer instance for a fence name or None. Shared, don't set options"""
+    try:
+        return instances[name]
+    except KeyError:
+        pass
+    lexer, spec = None, load().get(normalize(name))
+    if spec:
+        try:
+            lexer = getattr(import_module(spec[0]), spec[1])()
+        except (ImportError, AttributeError):
+            pass
+    instances[name] = lexer
+    return lexer
+
+
+def for_filename(fn):
+    """The alias for a source file name, e.g. 'python' for 'foo.py', or None"""
+    load()
+    fn = os.path.basename(fn or '')
+    if fn in filenames:
+        return filenames[fn]
+    return filenames.get(fn.rsplit('.', 1)[-1].lower()) if '.' in fn else None
@@ -8,6 +8,8 @@
 # Options:
     -A         : no_colors     : Strip all ansi (no colors then)
     -C MODE    : code_hilite   : Sourcecode highlighting mode
+    -D         : daemon        : Run the render daemon (see Render Daemon)
+    -E N       : explain_slow  : Report the N slowest blocks to stderr (also --explain-slow N)
     -F FILE    : config_file   : Alternative configfile (defaults ~./.mdv or ~/.config/mdv)
     -H         : do_html       : Print html version
     -L         : display_links : Backwards compatible shortcut for '-u i'
@@ -52,7 +54,7 @@ If you prefer shell style config then source and export so you have it as enviro
 
 ### **-c COLS**: Columns
 
-We use stty tool to derive terminal size. If you pipe into mdv we use 80 cols.
+We ask the terminal for its size (ioctl). If you pipe into mdv we use 80 cols.
 You can force the columns used via `-c`.
 If you export `$width`, this has precedence over `$COLUMNS`.
 
@@ -70,8 +72,8 @@ Example:
     -f 'Some Head:10' -> displays 10 lines after 'Some Head'
 
 If the substring is not found we set it to the *first* character of the file -
-resulting in output from the top (if your terminal height can be derived
-correctly through the stty cmd).
+resulting in output from the top (if your terminal height can be
+derived).
 
 
 ## Themes
@@ -115,6 +117,16 @@ Mark inline markdown with a '_' following the docstring beginnings.
 - mod: Only the module level docstring
 
 
+## Render Daemon
+
+`mdv -D` keeps a warm mdv resident (markdown, pygments, themes loaded),
+listening on a unix socket (`$MDV_SOCKET`, default in `$XDG_RUNTIME_DIR` or
+a private `/tmp/mdv-<uid>/`). It is only used when it is a socket of yours,
+not accessible by others. While it runs, `mdv <file>` sends the render request there, which is
+an order of magnitude faster than a cold start - nice e.g. for the theme
+browser previews. W/o daemon, mdv renders itself. `$MDV_NO_DAEMON` disables it.
+
+
 ## File Monitor:
 
 If FROM is not found we display the whole file.
@@ -158,26 +170,17 @@ if not PY3:
 
 import io
 import os
-import textwrap
-import shutil
+import threading
 import time
-import markdown
 import re
-import markdown.util
-
-try:
-    # in py3 not done automatically:
-    import xml.etree.cElementTree as etree
-except:
-    import xml.etree.ElementTree as etree
-
-from markdown.extensions.tables import TableExtension
-from random import randint
-from .tabulate import tabulate
-from json import loads
-from markdown.treeprocessors import Treeprocessor
-from markdown.extensions import Extension, fenced_code
+
+# markdown, pygments, tabulate and xml.etree are imported where first needed:
+# mdv is started from shell prompts and hooks, where import time dominates.
 from functools import partial
+from . import themes as theme_pack
+from . import daemon, guess, hlcache, lexers, table, wrap
+from .ansi import csi_re, slice as ansi_slice, strip as strip_ansi, width as ansi_width
+from .widths import columns, is_ascii
 
 errout, envget = partial(print, file=sys.stderr), os.environ.get
 err = lambda msg: errout(col(' ERR ', (1, 255, 124)) + ' %s' % msg)
@@ -259,7 +262,13 @@ link_start = '①'
 link_start_ord = ord(link_start)
 
 def_lexer = 'python'
+# for code blocks w/o language. 'pygments': its (slow) guess_lexer:
 guess_lexer = True
+# code blocks with more lines or chars are not lexed but 'fast' highlighted
+# (strings, numbers, comments; up to large_code_fast_chars, ~40ms) or
+# 'plain', in C. 0: no limit:
+large_code_lines, large_code_chars = 5000, 500000
+large_code_hl, large_code_fast_chars = 'fast', 100000
 # also global. but not in use, BG handling can get pretty involved, to do with
 # taste, since we don't know the term backg....:
 
@@ -288,55 +297,88 @@ mon_max_files = 1000
 
 
 def get_terminal_size():
-    """get terminal size for python3.3 or greater, using shutil.
+    """get terminal size via ioctl on the std streams (no stty subprocess).
 
-    taken and modified from http://stackoverflow.com/a/14422538
+    stdin first, like the stty tool did, so that `mdv foo.md | less` still
+    gets the width.
 
     Returns:
         tuple: (column, rows) from terminal size, or (0, 0) if error.
     """
-    error_terminal_size = (0, 0)
-    if hasattr(shutil, 'get_terminal_size'):
-        # The following statement will return 0, 0 if running by PyCharm in Windows,
+    for fd in 0, 1, 2:
+        try:
+            terminal_size = os.get_terminal_size(fd)
+        except (AttributeError, ValueError, OSError):
+            continue
+        # The following will be 0, 0 if running by PyCharm in Windows,
         # resulting in printing "!! Could not derive your terminal width !!" later.
-        # if raise error, it will cause "OSError: [WinError 6] The handle is invalid."
-        terminal_size = shutil.get_terminal_size(fallback=error_terminal_size)
-        return terminal_size.columns, terminal_size.lines
-    else:
-        return error_terminal_size
+        if terminal_size.columns:
+            return terminal_size.columns, terminal_size.lines
+    return 0, 0
 
 
-# zsh does not allow to override COLUMNS ! Thats why we also respect $width:
+# zsh does not allow to override COLUMNS ! Thats why we also respect $width.
+# W/o those we ask the terminal - but only when a render needs it, see
+# probe_term_size:
 term_columns, term_rows = envget('width', envget('COLUMNS')), envget('LINES')
-if not term_columns and not '-c' in sys.argv:
-    try:
-        if sys.platform != 'win32':
-            # The following statement will print "the system cannot find the path specified" in Windows, so omitting
-            term_rows, term_columns = (
-                os.popen('stty size 2>/dev/null', 'r').read().split()
-            )
-        else:
-            raise Warning('OS is win32, entering expect statement...')
-        term_columns, term_rows = int(term_columns), int(term_rows)
-    except:  # pragma: no cover
-        term_columns, term_rows = get_terminal_size()
-        if '-' not in sys.argv and (term_columns, term_rows) == (0, 0):
-            errout('!! Could not derive your terminal width !!')
-term_columns, term_rows = int(term_columns or 80), int(term_rows or 200)
+term_columns, term_rows = int(term_columns or 0), int(term_rows or 200)
 
 
-def parse_env_and_cli():
-    """replacing docopt"""
-    kw, argv = {}, list(sys.argv[1:])
-    opts = __doc__.split('# Options', 1)[1].split('# Details', 1)[0].strip()
-    opts = [_.lstrip().split(':', 2) for _ in opts.splitlines()]
-    opts = dict(
+def probe_term_size():
+    global term_columns, term_rows
+    if term_columns:
+        return
+    term_columns, rows = get_terminal_size()
+    if not term_columns and is_app and '-' not in sys.argv:
+        errout('!! Could not derive your terminal width !!')
+    term_columns, term_rows = term_columns or 80, rows or term_rows
+
+
+# The '# Options' table of __doc__, precomputed: option -> (takes_value, name)
+# (test_startup checks it is in sync with the doc)
+cli_opts = {
+    '-A': (0, 'no_colors'),
+    '-C': (1, 'code_hilite'),
+    '-D': (0, 'daemon'),
+    '-E': (1, 'explain_slow'),
+    '-F': (1, 'config_file'),
+    '-H': (0, 'do_html'),
+    '-L': (0, 'display_links'),
+    '-M': (1, 'monitor_dir'),
+    '-S': (0, 'theme_browser'),
+    '-T': (1, 'c_theme'),
+    '-X': (1, 'c_def_lexer'),
+    '-b': (1, 'tab_length'),
+    '-c': (1, 'cols'),
+    '-f': (1, 'from_txt'),
+    '-h': (0, 'sh_help'),
+    '-i': (0, 'theme_info'),
+    '-k': (0, 'keep_bg'),
+    '-m': (0, 'monitor_file'),
+    '-n': (1, 'header_nrs'),
+    '-s': (1, 'style_rules'),
+    '-t': (1, 'theme'),
+    '-u': (1, 'link_style'),
+    '-x': (0, 'c_no_guess'),
+}
+
+
+def parse_doc_opts(doc=None):
+    """The option table as documented in the module docstring"""
+    opts = (doc or __doc__).split('# Options', 1)[1].split('# Details', 1)[0]
+    opts = [_.lstrip().split(':', 2) for _ in opts.strip().splitlines()]
+    return dict(
         [
-            (l[0].split()[0], (l[0].split()[1:], l[1].strip(), l[2].strip()))
+            (l[0].split()[0], (int(len(l[0].split()) > 1), l[1].strip()))
             for l in opts
             if len(l) > 2
         ]
     )
+
+
+def parse_env_and_cli():
+    """replacing docopt"""
+    kw, argv, opts = {}, list(sys.argv[1:]), cli_opts
     # check environ (a lot - but all in all takes 0.00003s):
     aliases = {
         'MDV_C_THEME': ['AXC_CODE_THEME', 'MDV_CODE_THEME'],
@@ -353,9 +395,9 @@ def parse_env_and_cli():
     # walk cli args:
     while argv:
         k = argv.pop(0)
-        k = '-h' if k == '--help' else k
+        k = {'--help': '-h', '--explain-slow': '-E'}.get(k, k)
         try:
-            reqv, n = opts[k][:2]
+            reqv, n = opts[k]
             kw[n] = argv.pop(0) if reqv else True
         except:
             if not argv or exists(k):
@@ -365,26 +407,33 @@ def parse_env_and_cli():
     return kw
 
 
-# code analysis for hilite:
-try:
-    from pygments import lex, token
-    from pygments.lexers import get_lexer_by_name
-    from pygments.lexers import guess_lexer as pyg_guess_lexer
+# code analysis for hilite, pygments imported on first use (see load_pygments):
+have_pygments = None
 
-    have_pygments = True
-except ImportError:  # pragma: no cover
-    have_pygments = False
+
+def load_pygments():
+    global have_pygments, token, pyg_guess_lexer
+    if have_pygments is None:
+        try:
+            from pygments import token
+            from pygments.lexers import guess_lexer as pyg_guess_lexer
+
+            have_pygments = True
+        except ImportError:  # pragma: no cover
+            have_pygments = False
+    return have_pygments
 
 
 if PY3:
     unichr = chr
-    from html.parser import HTMLParser
+    from html import unescape
 
     string_type = str
 else:
     from HTMLParser import HTMLParser
 
     string_type = basestring
+    unescape = HTMLParser().unescape
 
     def breakpoint():
         import pdb
@@ -392,18 +441,9 @@ else:
         pdb.set_trace()
 
 
-if getattr(HTMLParser, 'unescape', None) is None:
-    from html import unescape
-else:
-    unescape = HTMLParser().unescape
-
-
-from xml.etree.ElementTree import Element
-
-if getattr(Element, 'getchildren', None) is None:
-    get_element_children = lambda el: el
-else:
-    get_element_children = lambda el: el.getchildren()
+# elements are sequences of their children (py2.7's ElementTree as well),
+# getchildren is deprecated. Saves importing xml.etree at startup:
+get_element_children = lambda el: el
 
 is_app = 0
 
@@ -425,12 +465,6 @@ def fix_py2_default_encoding():
         def_enc_set = True
 
 
-import logging
-
-md_logger = logging.getLogger('MARKDOWN')
-md_logger.setLevel(logging.WARNING)
-
-
 # below here you have to *know* what u r doing... (since I didn't too much)
 
 dir_mon_filepath_ph = '_fp_'
@@ -450,11 +484,11 @@ def readfile(fn, encoding='utf-8'):
 you_like = 'You like this theme?'
 
 
-def make_sample():
+def make_sample(r):
     """Generate the theme roller sample markdown"""
-    if md_sample:
+    if r.md_sample:
         # user has set another:
-        return md_sample
+        return r.md_sample
     _md = []
     for hl in range(1, 7):
         _md.append('#' * hl + ' ' + 'Header %s' % hl)
@@ -470,28 +504,20 @@ def make_sample():
 | !!! hint: wrapped | 0.1 **strong** |
     """
     _md.append(_)
-    for ad in list(admons.keys())[:1]:
+    for ad in list(r.admons.keys())[:1]:
         _md.append('!!! %s: title\n    this is a %s\n' % (ad, ad.capitalize()))
     # 'this theme' replaced in the roller (but not at mdv w/o args):
     _ = '\n'.join(_md) + '\n----\n!!! question: %s' % you_like
-    globals()['md_sample'] = _
-
+    r.md_sample = _
+    return _
 
-code_hl_tokens = {}
 
-
-def build_hl_by_token():
-    if not have_pygments:
-        return
-    # replace code strs with tokens:
-    for k, col in list(code_hl.items()):
-        code_hl_tokens[getattr(token, k)] = globals()[col]
+ansi_escape = csi_re
 
 
 def clean_ansi(s):
     # if someone does not want the color foo:
-    ansi_escape = re.compile(r'\x1b[^m]*m')
-    return ansi_escape.sub('', s)
+    return strip_ansi(s)
 
 
 # markers: tab is 09, omit that
@@ -503,6 +529,19 @@ punctuationmark = '\x13'
 fenced_codemark = '\x14'
 hr_marker = '\x15'
 no_split = '\x19'
+# inline styles: start marker -> end marker, the role coloring it, underline:
+marker_styles = {
+    code_start: (code_end, 'H2', 0),
+    stng_start: (stng_end, 'H2', 0),
+    link_start: (link_end, 'H2', 1),
+    emph_start: (emph_end, 'H3', 0),
+}
+marker_ends = dict((v[0], k) for k, v in marker_styles.items())
+# zero width, for wrapping:
+invisible_markers = ''.join(list(marker_styles) + list(marker_ends)) + (
+    punctuationmark + fenced_codemark + hr_marker + no_split
+)
+markers_re = re.compile('([%s])' % ''.join(list(marker_styles) + list(marker_ends)))
 
 
 def j(p, f):
@@ -512,61 +551,19 @@ def j(p, f):
 mydir = os.path.realpath(__file__).rsplit(os.path.sep, 1)[0]
 
 
-def style_ansi(raw_code, lang=None):
+def style_ansi(raw_code, lang=None, prefix=''):
     """actual code hilite"""
-
-    def lexer_alias(n):
-        # markdown lib now creates "language-python" (pygments still wants "python")
-        if n.startswith('language-'):
-            n = n[9:]
-        # not found:
-        if n == 'markdown':
-            return 'md'
-        return n
-
-    lexer = 0
-    if lang:
-        try:
-            lexer = get_lexer_by_name(lexer_alias(lang))
-        except Exception as ex:
-            err(ex)
-
-    if not lexer:
-        try:
-            if guess_lexer:
-                # takes a long time!
-                lexer = pyg_guess_lexer(raw_code)
-        except:
-            pass
-
-    if not lexer:
-        for l in def_lexer, 'yaml', 'python', 'c':
-            try:
-                lexer = get_lexer_by_name(lexer_alias(l))
-                break
-            except:
-                # OUR def_lexer (python) was overridden,but not found.
-                # still we should not fail. lets use yaml. or python:
-                continue
-
-    tokens = lex(raw_code, lexer)
-    cod = []
-    for t, v in tokens:
-        if not v:
-            continue
-        _col = code_hl_tokens.get(t) or C  # color
-        cod.append(col(v, _col))
-    return ''.join(cod)
+    return current().style_ansi(raw_code, lang, prefix)
 
 
 def low(s):
     # shorthand
-    return col(s, L)
+    return current().low(s)
 
 
 def plain(s, **kw):
     # when a tag is not found:
-    return col(s, T)
+    return current().plain(s)
 
 
 def sh(out):
@@ -577,23 +574,16 @@ def sh(out):
 
 # --------------------------------------------------------- Tag formatter funcs
 
-# number these header levels:
+# number these header levels (default, main's header_nrs overrides):
 header_nr = {'from': 0, 'to': 0}
-# current state scanning the document:
-cur_header_state = {i: 0 for i in range(1, 11)}
-
-
-def reset_cur_header_state():
-    """after one document is complete"""
-    [into(cur_header_state, i, 0) for i in range(1, 11)]
 
 
 def parse_header_nrs(nrs):
-    """nrs e.g. 4-10 or 1-"""
+    """nrs e.g. 4-10 or 1- -> {'from': 4, 'to': 10}"""
     if not nrs:
         return
     if isinstance(nrs, dict):
-        return header_nr.update(nrs)
+        return dict(header_nr, **nrs)
     if isinstance(nrs, string_type):
         if nrs.startswith('-'):
             nrs = '1' + nrs
@@ -604,10 +594,8 @@ def parse_header_nrs(nrs):
         nrs = nrs.split('-')[0:2]
     try:
         if isinstance(nrs, (tuple, list)):
-            header_nr['from'] = int(nrs[0])
-            header_nr['to'] = int(nrs[1])
-            return
-    except Extension as ex:
+            return {'from': int(nrs[0]), 'to': int(nrs[1])}
+    except ValueError:
         errout('header numbering not understood', nrs)
         sys.exit(1)
 
@@ -620,8 +608,13 @@ class Tags:
     _last_header_level = 0
     """ can be overwritten in derivations. """
 
+    def __init__(_, renderer=None):
+        _.r = renderer or current()
+        # current state scanning the document:
+        _.cur_header_state = {i: 0 for i in range(1, 11)}
+
     def update_header_state(_, level):
-        cur = cur_header_state
+        cur = _.cur_header_state
         if _._last_header_level > level:
             [into(cur, i, 0) for i in range(level + 1, 10)]
 
@@ -631,7 +624,7 @@ class Tags:
         cur[level] += 1
         _._last_header_level = level
         ret = ''
-        f, t = header_nr['from'], header_nr['to']
+        f, t = _.r.header_nr['from'], _.r.header_nr['to']
         if level >= f and level <= t:
             ret = '.'.join(
                 [str(cur[i]) for i in range(f, t + 1) if cur[i] > 0]
@@ -647,154 +640,85 @@ class Tags:
             s = ' ' + s.lstrip()
         # have not more colors:
         header_col = min(level, 10)
+        r = _.r
         _ = '\n%s%s%s'
-        return _ % (low('#' * 0), nrstr, col(s, globals()['H%s' % header_col]))
+        return _ % (r.low('#' * 0), nrstr, r.col(s, getattr(r, 'H%s' % header_col)))
 
     def p(_, s, **kw):
-        return col(s, T)
+        return _.r.col(s, _.r.T)
 
     def a(_, s, **kw):
-        return col(s, L)
+        return _.r.col(s, _.r.L)
 
     def hr(_, s, **kw):
         # we want nice line seps:
+        r = _.r
         hir = kw.get('hir', 1)
-        ind = (hir - 1) * left_indent
-        s = e = col(hr_ends, globals()['H%s' % hir])
-        return low('\n%s%s%s%s%s\n' % (ind, s, hr_marker, e, ind))
+        ind = (hir - 1) * r.left_indent
+        s = e = r.col(r.hr_ends, getattr(r, 'H%s' % hir))
+        return r.low('\n%s%s%s%s%s\n' % (ind, s, hr_marker, e, ind))
 
     def code(_, s, from_fenced_block=None, **kw):
         """md code AND ``` style fenced raw code ends here"""
         lang = kw.get('lang')
         if not from_fenced_block:
             s = ('\n' + s).replace('\n    ', '\n')[1:]
-
-        # funny: ":-" confuses the tokenizer. replace/backreplace:
-        raw_code = s.replace(':-', '\x01--')
-        if have_pygments:
-            s = style_ansi(raw_code, lang=lang)
-
+        r = _.r
         # outest hir is 2, use it for fenced:
         ind = ' ' * kw.get('hir', 2)
         # if from_fenced_block: ... WE treat equal.
 
+        # we want an indent of one and low vis prefix:
+        prefix = r.code_prefix(ind)
+        if load_pygments():
+            # lines come prefixed:
+            return '\n' + r.style_ansi(s, lang=lang, prefix=prefix) + '\n' + r.reset_col
+
         # shift to the far left, no matter the indent (screenspace matters):
         firstl = s.split('\n')[0]
         del_spaces = ' ' * (len(firstl) - len(firstl.lstrip()))
         s = ('\n' + s).replace('\n%s' % del_spaces, '\n')[1:]
-
-        # we want an indent of one and low vis prefix. this does it:
-        code_lines = ('\n' + s).splitlines()
-        prefix = '\n%s%s %s' % (ind, low(code_pref), col('', C, no_reset=1))
-        code_lines.pop() if code_lines[-1] == '\x1b[0m' else None
-        code = prefix.join(code_lines)
-        code = code.replace('\x01--', ':-')
-        return code + '\n' + reset_col
+        prefix = '\n%s%s' % (prefix, r.col('', r.C, no_reset=1))
+        return prefix + prefix.join(s.splitlines()) + '\n' + r.reset_col
 
 
-if PY3:
-    elstr = lambda el: etree.tostring(el).decode('utf-8')
-else:
-    elstr = lambda el: etree.tostring(el)
+def stashed_code(raw):
+    """(code, language) of a stashed fenced code block (unescaped), else
+    None"""
+    pre = '<pre><code'
+    if not raw.startswith(pre):
+        return
+    raw = raw.split(pre, 1)[1]
+    # language:
+    lang = raw.split('class="', 1)[1].split('"')[0] if 'class="' in raw else ''
+    return raw.split('>', 1)[1].rsplit('</code>', 1)[0].strip(), lang
 
 
-def is_text_node(el):
-    """ """
-    s = elstr(el)
-    # strip our tag:
-    html = s.split('<%s' % el.tag, 1)[1].split('>', 1)[1].rsplit('>', 1)[0]
-    # do we start with another tagged child which is NOT in inlines:?
-    if not html.startswith('<'):
-        return 1, html
-    for inline in ('<a', '<em>', '<code>', '<strong>'):
-        if html.startswith(inline):
-            return 1, html
-    return 0, 0
+def elstr(el):
+    from xml.etree.ElementTree import tostring
 
+    s = tostring(el)
+    return s.decode('utf-8') if PY3 else s
 
-# ----------------------------------------------------- Text Termcols Adaptions
-def rewrap(el, t, ind, pref):
-    """Reasonably smart rewrapping checking punctuations"""
-    cols = max(term_columns - len(ind + pref), 5)
-    if el.tag == 'code' or len(t) <= cols:
-        return t
 
-    # this is a code replacement marker of markdown.py. Don't split the
-    # replacement marker:
-    if t.startswith('\x02') and t.endswith('\x03'):
-        return t
+# inline tags we turn into markers:
+inline_markers = {
+    'code': (code_start, code_end),
+    'strong': (stng_start, stng_end),
+    'em': (emph_start, emph_end),
+}
 
-    dedented = textwrap.dedent(t).strip()
-    ret = textwrap.fill(dedented, width=cols)
-    return ret
-
-    # forgot why I didn't use textwrap from the beginning. In case there is a
-    # reason I leave the old code here:
-    # edit: think it was because of ansi code unawareness of textwrap.
-    # wrapping:
-    # we want to keep existing linebreaks after punctuation
-    # marks. the others we rewrap:
-
-    # puncs = ',', '.', '?', '!', '-', ':'
-    # parts = []
-    # origp = t.splitlines()
-    # if len(origp) > 1:
-    #    pos = -1
-    #    while pos < len(origp) - 1:
-    #        pos += 1
-    #        # last char punctuation?
-    #        if origp[pos][-1] not in puncs and \
-    #                not pos == len(origp) - 1:
-    #            # concat:
-    #            parts.append(origp[pos].strip() + ' ' + origp[pos + 1].strip())
-    #            pos += 1
-    #        else:
-    #            parts.append(origp[pos].strip())
-    #    t = '\n'.join(parts)
-    ## having only the linebreaks with puncs before we rewrap
-    ## now:
-    # parts = []
-    # for part in t.splitlines():
-    #    parts.extend([part[i:i+cols] for i in range(0, len(part), cols)])
-    ## last remove leading ' ' (if '\n' came just before):
-    # t = []
-    # for p in parts:
-    #    t.append(p.strip())
-    # return '\n'.join(t)
-
-
-def split_blocks(text_block, w, cols, part_fmter=None):
-    """splits while multiline blocks vertically (for large tables)"""
-    ts = []
-    for line in text_block.splitlines():
-        parts = []
-        # make equal len:
-        line = line.ljust(w, ' ')
-        # first part full width, others a bit indented:
-        parts.append(line[:cols])
-        scols = cols - 2
-        # the txt_block_cut in low makes the whole secondary tables
-        # low. which i find a feature:
-        # if you don't want it remove the col(.., L)
-        parts.extend(
-            [
-                ' ' + col(txt_block_cut, L, no_reset=1) + line[i : i + scols]
-                for i in range(cols, len(line), scols)
-            ]
-        )
-        ts.append(parts)
 
-    blocks = []
-    for block_part_nr in range(len(ts[0])):
-        tpart = []
-        for lines_block in ts:
-            tpart.append(lines_block[block_part_nr])
-        if part_fmter:
-            part_fmter(tpart)
-        tpart[1] = col(tpart[1], H3)
-        blocks.append('\n'.join(tpart))
-    t = '\n'.join(blocks)
-    return '\n%s\n' % t
+def is_text_node(el):
+    """Text, maybe with inline markup - or do we start with another tagged
+    child which is NOT in inlines (e.g. li with a p)?"""
+    if el.text or not len(el):
+        return 1
+    c = el[0]
+    if c.tag[0] == 'a':
+        return 1
+    # (an empty <em> would have been '<em />' in html:)
+    return int(c.tag in inline_markers and not c.attrib and bool(c.text or len(c)))
 
 
 # ---------------------------------------------------- Create the treeprocessor
@@ -806,58 +730,21 @@ def to_unescaped(raw):
     return raw
 
 
-def replace_links(el, html):
-    """digging through inline "<a href=..." """
-    parts = html.split('<a ')
-    if len(parts) == 1:
-        return None, html
-    links_list, cur_link = [], 0
-    links = [l for l in get_element_children(el) if 'href' in l.keys()]
-    if not len(parts) == len(links) + 1:
-        # there is an html element within which we don't support,
-        # e.g. blockquote
-        return None, html
-    cur = ''
-    while parts:
-        cur += parts.pop(0).rsplit('</a>')[-1]
-        if not parts:
-            break
-
-        # indicating link formatting start:
-        cur += link_start
-
-        # the 'a' xml element:
-        link = links[cur_link]
-
-        # bug in the markdown api? link el is not providing inlines!!
-        # -> get them from the html:
-        # cur += link.text or ''
-        _ = parts[0].split('>', 1)[1].split('</a', 1)[0] or ''
-        cur += to_unescaped(_)
-        cur += link_end
-        if show_links != 'h':
-            if show_links == 'i':
-                cur += low('(%s)' % link.get('href', ''))
-            else:  # inline table (it)
-                # we build a link list, add the number like ① :
-                try:
-                    cur += '%s ' % unichr(link_start_ord + cur_link)
-                except NameError:
-                    # fix for py3
-                    # http://stackoverflow.com/a/2352047
-                    cur += '%s ' % chr(link_start_ord + cur_link)
-                links_list.append(to_unescaped(link.get('href', '')))
-        cur_link += 1
-    return links_list, cur
+class AnsiPrinter(object):
+    """A markdown Treeprocessor (duck typed, markdown is imported lazily)"""
 
-
-class AnsiPrinter(Treeprocessor):
     header_tags = ('h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'h7', 'h8', 'h9', 'h10')
 
+    def __init__(self, md=None, renderer=None):
+        self.md = md
+        self.renderer = renderer
+
     def run(self, doc):
-        tags = Tags()
+        r = self.renderer or current()
+        col, low = r.col, r.low
+        tags = Tags(r)
         # define tag handlers for all header levels, based on def h:
-        for h in cur_header_state:
+        for h in range(1, 11):
             setattr(tags, 'h%s' % h, partial(tags.h, level=h))
 
         def get_attr(el, attr):
@@ -889,7 +776,7 @@ class AnsiPrinter(Treeprocessor):
                 for el1 in get_element_children(el):
                     iout = []
                     formatter(el1, iout, hir + 2, parent=el)
-                    pr = col(bquote_pref, H1)
+                    pr = col(r.bquote_pref, r.H1)
                     sp = ' ' * (hir + 2)
                     for l in iout:
                         for l1 in l.splitlines():
@@ -913,24 +800,12 @@ class AnsiPrinter(Treeprocessor):
                 if el.tag == 'code':
                     t = unescape(el.text)
                 else:
-                    is_txt_and_inline_markup, html = is_text_node(el)
+                    is_txt_and_inline_markup = is_text_node(el)
 
                     if is_txt_and_inline_markup:
                         # foo:  \nbar -> will be seing a foo:<br>bar with
                         # mardkown.py. Code blocks are already quoted -> no prob.
-                        html = html.replace('<br />', '\n')
-                        # strip our own closing tag:
-                        t = html.rsplit('<', 1)[0]
-                        links_list, t = replace_links(el, html=t)
-                        for tg, start, end in (
-                            ('<code>', code_start, code_end),
-                            ('<strong>', stng_start, stng_end),
-                            ('<em>', emph_start, emph_end),
-                        ):
-                            t = t.replace('%s' % tg, start)
-                            close_tag = '</%s' % tg[1:]
-                            t = t.replace(close_tag, end)
-                        t = unescape(t)
+                        links_list, t = r.inline(el)
                     else:
                         t = el.text
                 t = t.strip()
@@ -939,14 +814,14 @@ class AnsiPrinter(Treeprocessor):
                 if t.startswith('!!! '):
                     # we allow admons with spaces. so check for startswith:
                     _ad = None
-                    for k in admons:
+                    for k in r.admons:
                         if t[4:].startswith(k):
-                            _ad = k
+                            _ad = r.admons[k]
                             break
                     # not found - markup using hte first one's color:
                     if not _ad:
                         k = t[4:].split(' ', 1)[0]
-                        admons[k] = list(admons.values())[0]
+                        _ad = list(r.admons.values())[0]
 
                     pref = body_pref = '┃ '
                     pref += k.capitalize()
@@ -961,7 +836,7 @@ class AnsiPrinter(Treeprocessor):
                     body_pref = ' ' * len(pref)
                     el.set('pref', '')
 
-                ind = left_indent * hir
+                ind = r.left_indent * hir
                 hl = None
 
                 # for hl > 6, e.g. 8, the lib stops at h6, with "## title" -> drop the ##, count up the h6 to h8:
@@ -976,18 +851,18 @@ class AnsiPrinter(Treeprocessor):
                     hl = int(el.tag[1:])
                     ind = ' ' * (hl - 1)
                     hir += hl
-                t = rewrap(el, t, ind, pref)
+                t = r.rewrap(el, t, ind, pref)
 
                 # indent. can color the prefixes now, no more len checks:
                 if admon:
                     out.append('\n')
-                    pref = col(pref, globals()[admons[admon]])
-                    body_pref = col(body_pref, globals()[admons[admon]])
+                    pref = col(pref, getattr(r, _ad))
+                    body_pref = col(body_pref, getattr(r, _ad))
 
                 if pref:
                     # different color per indent:
-                    h = globals()['H%s' % (((hir - 2) % 5) + 1)]
-                    if pref == list_pref:
+                    h = getattr(r, 'H%s' % (((hir - 2) % 5) + 1))
+                    if pref == r.list_pref:
                         pref = col(pref, h)
                     elif pref.split('.', 1)[0].isdigit():
                         pref = col(pref, h)
@@ -1005,7 +880,7 @@ class AnsiPrinter(Treeprocessor):
                 # delivers <li><p>foo</p> instead of <li>foo, i.e. we have to
                 # omit the linebreak and append the text of p to the previous
                 # result, (i.e. the list separator):
-                tag_fmt_func = getattr(tags, el.tag, plain)
+                tag_fmt_func = getattr(tags, el.tag, r.plain)
                 if (
                     type(parent) == type(el)
                     and parent.tag == 'li'
@@ -1016,6 +891,16 @@ class AnsiPrinter(Treeprocessor):
                     out[-1] += _out
                 else:
                     out.append(tag_fmt_func(t, hir=hir))
+                if (
+                    is_txt_and_inline_markup
+                    and el.tag == 'li'
+                    and len(el)
+                    and el[-1].tag in ('ul', 'ol')
+                ):
+                    # do we have a nested sublist? the li was inline
+                    # formatted up to its <ul>, split that off, the list is
+                    # formatted as own tag (see below):
+                    out[-1] = out[-1].split('<%s>' % el[-1].tag, 1)[0]
 
                 if admon:
                     out.append('\n')
@@ -1033,20 +918,15 @@ class AnsiPrinter(Treeprocessor):
                     childs = get_element_children(el)
                     for nested in 'ul', 'ol':
                         if childs and childs[-1].tag == nested:
-                            ul = childs[-1]
-                            # do we have a nested sublist? the li was inline
-                            # formattet,
-                            # split all from <ul> off and format it as own tag:
                             # (ul always at the end of an li)
-                            out[-1] = out[-1].split('<%s>' % nested, 1)[0]
-                            formatter(ul, out, hir + 1, parent=el)
+                            formatter(childs[-1], out, hir + 1, parent=el)
                 return
 
             if el.tag == 'table':
                 # processed all here, in one sweep:
                 # markdown ext gave us a xml tree from the ascii,
                 # our part here is the cell formatting and into a
-                # python nested list, then tabulate spits
+                # python nested list, then table.layout spits
                 # out ascii again:
                 def borders(t):
                     t[0] = t[-1] = low(t[0].replace('-', '─'))
@@ -1058,22 +938,25 @@ class AnsiPrinter(Treeprocessor):
                     formatter(cell, out=_cell, hir=0, parent=parent)
                     return '\n'.join(_cell)
 
-                t = []
+                t, aligns = [], []
                 for he_bo in 0, 1:
                     for Row in get_element_children(el[he_bo]):
                         row = []
                         t.append(row)
                         for cell in get_element_children(Row):
                             row.append(fmt(cell, row))
-                cols = term_columns
-                # good ansi handling:
-                tbl = tabulate(t)
+                            if not he_bo:
+                                aligns.append(table.align(cell))
+
+                r.note('table: %s rows, %s cols' % (len(t), max([len(row) for row in t] or [0])))
+                cols = r.term_columns
+                widths, lines = table.layout(t, aligns)
 
                 # do we have right room to indent it?
                 # first line is seps, so no ansi esacapes foo:
-                w = len(tbl.split('\n', 1)[0])
+                w = len(lines[0])
                 if w <= cols:
-                    t = tbl.splitlines()
+                    t = lines
                     borders(t)
                     # center:
                     ind = (cols - w) / 2
@@ -1081,33 +964,21 @@ class AnsiPrinter(Treeprocessor):
                     ind = hir
                     tt = []
                     for line in t:
-                        tt.append('%s%s' % (ind * left_indent, line))
+                        tt.append('%s%s' % (ind * r.left_indent, line))
                     out.extend(tt)
                 else:
                     # TABLE CUTTING WHEN NOT WIDTH FIT
                     # oh snap, the table bigger than our screen. hmm.
-                    # hey lets split into vertical parts:
-                    # but len calcs are hart, since we are crammed with esc.
-                    # seqs.
-                    # -> get rid of them:
-                    tc = []
-                    for row in t:
-                        tc.append([])
-                        l = tc[-1]
-                        for cell in row:
-                            l.append(clean_ansi(cell))
-                    # again sam:
-                    # note: we had to patch it, it inserted '\n' within cells!
-                    table = tabulate(tc)
-                    out.append(
-                        split_blocks(table, w, cols, part_fmter=borders)
-                    )
+                    # hey lets split into vertical parts, at the column
+                    # boundaries of the layout we have, colors kept:
+                    r.note('wider than the terminal: split_blocks')
+                    out.append(r.split_blocks(lines, widths, cols, part_fmter=borders))
                 return
 
             nr = 0
             for c in el:
                 if el.tag == 'ul':  # or el.tag == 'li':
-                    c.set('pref', list_pref)
+                    c.set('pref', r.list_pref)
                 elif el.tag == 'ol':
                     nr += 1
                     c.set('pref', str(nr) + '. ')
@@ -1118,151 +989,234 @@ class AnsiPrinter(Treeprocessor):
             #    out.append('\n')
 
         out = []
-        formatter(doc, out)
+        costs = getattr(r.local, 'costs', None)
+        if costs is None:
+            formatter(doc, out)
+        else:
+            # explain_slow: same as formatter(doc, out), timed per block
+            setup = r.local.setup_cost
+            for c in doc:
+                cost = r.cost_start(c)
+                n, s0 = len(out), setup['secs']
+                formatter(c, out, 1, parent=doc)
+                # (w/o the lexer imports, the setup's):
+                cost['secs'] += time.time() - cost.pop('t0') - (setup['secs'] - s0)
+                cost['stashed'] = [int(i) for i in placeholder_re().findall('\n'.join(out[n:]))]
+                costs.append(cost)
+            r.local.cost_notes = None
         self.md.lines = len(out)
         self.md.ansi = '\n'.join(out)
 
 
-def add_bg_reset(result):
-    _ = 'MDV_NO_ANSI_CURSOR_MVMT'
-    if not BG or envget(_, '').lower() in {'true', '1'}:
-        return result
-    dl = len(result.splitlines())
-    r = min(term_rows, dl)
-    ret = '\n' + reset_col + '\n'.join([' ' * term_columns for i in range(r)])
-    ret += esc + str(r) + 'A'
-    return ret + result
-
-
-def set_hr_widths(result):
-    """
-    We want the hrs indented by hirarchy...
-    A bit 2 much effort to calc, maybe just fixed with 10
-    style seps would have been enough visually:
-    ◈────────────◈
-    """
-    # set all hrs to max width of text:
-    mw = 0
-    hrs = []
-    if hr_marker not in result:
-        return result
-    for line in result.splitlines():
-        if hr_marker in line:
-            hrs.append(line)
-            continue
-        if len(line) < mw:
-            continue
-        l = len(clean_ansi(line))
-        if l > mw:
-            mw = l
-
-    for hr in hrs:
-        # pos of hr marker is indent, derives full width:
-        # (more indent = less '-'):
-        hcl = clean_ansi(hr)
-        ind = len(hcl) - len(hcl.split(hr_marker, 1)[1]) - 1
-        w = min(term_columns, mw) - 2 * ind
-        hrf = hr.replace(hr_marker, hr_sep * w)
-        result = result.replace(hr, hrf)
-    return result
+# Then tell markdown about it
+def register_ansi_printer(md, renderer=None):
+    md.treeprocessors.register(AnsiPrinter(md, renderer), 'ansi_print_ext', 15)
 
 
-# Then tell markdown about it
-class AnsiPrintExtension(Extension):
-    def extendMarkdown(self, md):
-        ansi_print_ext = AnsiPrinter(md)
-        md.treeprocessors.register(ansi_print_ext, 'ansi_print_ext', 15)
+def make_markdown(tab_length=4, renderer=None):
+    """The markdown lib is imported here, i.e. only when we render"""
+    import logging
+    import markdown
 
+    logging.getLogger('MARKDOWN').setLevel(logging.WARNING)
+    from markdown.extensions.tables import TableExtension
+    from markdown.extensions.fenced_code import FencedCodeExtension
 
-def do_code_hilite(md, what='all'):
-    """
-    "inverse" mode for source code highlighting:
-    the file contains mainly code and md is within docstrings
-    what in  all, code, doc, mod
-    """
+    md = markdown.Markdown(
+        tab_length=int(tab_length),
+        extensions=[TableExtension(), FencedCodeExtension()],
+    )
+    register_ansi_printer(md, renderer)
+    # before fenced_code, after whitespace normalization:
+    md.preprocessors.register(SourcePreprocessor(md, renderer), 'mdv_source', 27)
+    return md
+
+
+ph_re = None
+
+
+def placeholder_re():
+    """markdown's htmlStash placeholders, group 1 is the block nr"""
+    global ph_re
+    if ph_re is None:
+        from markdown.util import HTML_PLACEHOLDER as PH
+
+        ph_re = re.compile(re.escape(PH).replace(re.escape('%s'), r'(\d+)'))
+    return ph_re
+
+
+def convert_ansi(md, source):
+    """md.convert, but stopping after our AnsiPrinter: No html serialization,
+    no postprocessors, we don't need their result"""
+    md.ansi = ''
+    if not source.strip():
+        return md.ansi
+    md.lines = source.split('\n')
+    for prep in md.preprocessors:
+        md.lines = prep.run(md.lines)
+    root = md.parser.parseDocument(md.lines).getroot()
+    for treeprocessor in md.treeprocessors:
+        new_root = treeprocessor.run(root)
+        if isinstance(treeprocessor, AnsiPrinter):
+            break
+        if new_root is not None:
+            root = new_root
+    return md.ansi
+
+
+def depth(el):
+    """Nesting depth of the lists and quotes in el"""
+    d = max([depth(c) for c in el] or [0])
+    return d + 1 if el.tag in ('ul', 'ol', 'blockquote') else d
+
+
+def locate_costs(costs, md):
+    """explain_slow: sets the (first, last) source lines of the timed blocks,
+    found by the start of their text, in order. None if not found"""
+    lines, i, starts = md.split('\n'), 0, []
+    for c in costs:
+        key = c['text'].strip().split('\n', 1)[0][:30].strip()
+        j = i
+        while key and j < len(lines) and key not in lines[j]:
+            j += 1
+        found = key and j < len(lines)
+        if found and c['kind'] == 'code' and j and lines[j - 1].lstrip()[:3] in ('```', '~~~'):
+            j -= 1
+        starts.append(j if found else None)
+        i = j + 1 if found else i
+    ends = [None] * len(starts)
+    end = len(lines)
+    for k in range(len(starts) - 1, -1, -1):
+        if starts[k] is None:
+            continue
+        e = end
+        while e > starts[k] + 1 and not lines[e - 1].strip():
+            e -= 1
+        ends[k], end = e, starts[k]
+    for c, start, end in zip(costs, starts, ends):
+        c['lines'] = (start + 1, end) if start is not None else None
+
+
+def __getattr__(name):
+    # AnsiPrintExtension, for who registers mdv into an own markdown instance.
+    # Subclassing markdown's Extension requires the import, so on demand:
+    if name != 'AnsiPrintExtension':
+        raise AttributeError(name)
+    from markdown.extensions import Extension
+
+    class AnsiPrintExtension(Extension):
+        def extendMarkdown(self, md):
+            register_ansi_printer(md)
+
+    globals()[name] = AnsiPrintExtension
+    return AnsiPrintExtension
+
+
+def source_regions(lines, what='all'):
+    """-C mode, "inverse" markdown: lines of source code with markdown in
+    docstrings, opened by a line of three quotes or '/*', followed by '_'.
+    Yields (is_code, lines) of the non empty regions, in one pass.
+    what in all, code, doc (only the module docstring), mod"""
     if what not in ('all', 'code', 'doc', 'mod'):
         what = 'all'
-    code_mode, md_mode = 1, 2
-    blocks, block, mode = [], [], code_mode
-    blocks.append([mode, block])
-    lines = ('\n' + md).splitlines()
-    mdstart = '\x01'
-    while lines:
-        line = lines.pop(0)
-        if mode == code_mode:
+    is_code, block, end = True, [''], None
+    for line in lines:
+        if is_code:
             if line.rstrip() in ('"""_', "'''_", '/*_'):
-                mdstart = line.rstrip()[:-1]
-                mode = md_mode
-                block = []
-                if mdstart == '/*':
-                    mdstart = '*/'
-                blocks.append([md_mode, block])
+                end = line.rstrip()[:-1]
+                end = '*/' if end == '/*' else end
+                if block and what in ('all', 'code'):
+                    yield True, block
+                is_code, block = False, []
                 continue
-
-        elif line.rstrip() == mdstart:
+        elif line.rstrip() == end:
+            if block and what != 'code':
+                yield False, block
             if what == 'doc':
-                # only module level docstring:
-                break
-            mode = code_mode
-            block = []
-            blocks.append([code_mode, block])
+                return
+            is_code, block = True, []
             continue
+        block.append(line)
+    if block and (what in ('all', 'code') if is_code else what != 'code'):
+        yield is_code, block
 
-        if mode == code_mode:
-            if what in ('all', 'code'):
-                block.append(line)
-
-        elif what != 'code':
-            block.append(line)
 
+def do_code_hilite(md, what='all', lang=None):
+    """
+    "inverse" mode for source code highlighting, as markdown with code
+    fences, see source_regions. Renderer.render does not need this, its
+    SourcePreprocessor stashes the code regions
+    lang: of the code blocks, guessed if not given
+    """
     out = []
-    for mode, block in blocks:
+    for is_code, block in source_regions(md.splitlines(), what):
         b = '\n'.join(block)
-        if not b:
-            continue
-        if mode == code_mode:
-            out.append('```\n%s\n```' % b)
-        else:
-            out.append('\n'.join(block))
+        if b:
+            out.append('```%s\n%s\n```' % (lang or '', b) if is_code else b)
     return '\n'.join(out)
 
 
-def set_bw_compat_rules(d, theme, c_theme):
+class SourcePreprocessor(object):
+    """A markdown Preprocessor (duck typed): for -C, the renderer's
+    local.source is (what, lang). Markdown gets the doc regions, code
+    regions are stashed like fenced code, i.e. no code fences to search for,
+    not parsed by markdown at all"""
+
+    def __init__(self, md=None, renderer=None):
+        self.md = md
+        self.renderer = renderer
+
+    def run(self, lines):
+        source = getattr((self.renderer or current()).local, 'source', None)
+        if not source:
+            return lines
+        what, lang = source
+        store, out = self.md.htmlStash.store, []
+        attr = ' class="language-%s"' % lang if lang else ''
+        esc = lambda s: s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        # the source's splitlines(), without the '\n\n' markdown appended -
+        # trailing blank lines of the file stay, like in do_code_hilite:
+        lines = lines[:-2]
+        if lines and not lines[-1]:
+            lines.pop()
+        for is_code, block in source_regions(lines, what):
+            b = '\n'.join(block)
+            if not b:
+                continue
+            if is_code:
+                # like fenced code:
+                out.extend(('', store('<pre><code%s>%s\n</code></pre>' % (attr, esc(b))), ''))
+            else:
+                out.extend(block)
+        return out
+
+
+def set_bw_compat_rules(theme, c_theme):
     if (  # we need to stay backwards compat to when only the 5color jsons where avail:
         theme
         and c_theme
-        and exists('%s/%s.json' % (d, theme))
-        and exists('%s/%s.json' % (d, c_theme))
+        and theme_pack.get(theme, '5color')
+        and theme_pack.get(c_theme, '5color')
     ):
         return 'BG=false;H1="base09";H2="base0A";H3="base0B";H4="base0C";H5="base0D";H6=H7=H8=H9=H5'
 
 
-def exec_py_config_file(added_style_rules):
+def exec_py_config_file(added_style_rules, ns=None):
+    """ns: the namespace configured, default our globals"""
     s = readfile(py_config_file) + '\n' + added_style_rules
     if not s.strip():
         return
-    exec('false=False; true=True\n' + s, globals())
-
-
-def random_theme(dirs):
-    r = []
-    [r.extend([k for k in os.listdir(d) if k.endswith('.json')]) for d in dirs]
-    return r[randint(0, len(r))].rsplit('.json')[0]
+    exec('false=False; true=True\n' + s, globals() if ns is None else ns)
 
 
-def load_theme(dirs, theme):
-    f = ['%s/%s.json' % (d, theme) for d in dirs]
-    f = [fn for fn in f if exists(fn)]
-    if not f:
-        die('Theme not found %s. Searched %s' % (theme, dirs))
-    B16.update(loads(readfile(f[0])))
+def random_theme():
+    return theme_pack.random_name()
 
 
-def read_md(filename, encoding):
+def read_md(filename, encoding, r=None):
     if not filename:
         print('Using sample markdown:')
-        make_sample()
-        md = md_sample
+        md = make_sample(r or current())
         print('Styling Result')
         return md
     if filename == '-':
@@ -1273,6 +1227,846 @@ def read_md(filename, encoding):
         return readfile(filename, encoding=encoding)
 
 
+class TokenColors(dict):
+    """pygments token type -> escape sequence, resolved on first lookup"""
+
+    def __init__(self, resolve):
+        self.resolve = resolve
+
+    def __missing__(self, ttype):
+        self[ttype] = s = self.resolve(ttype)
+        return s
+
+
+# TokenColors, by Renderer.code_colors:
+token_tables = {}
+
+
+def code_token_table(colors):
+    """The TokenColors of colors (Renderer.code_colors), shared by the
+    renderers with the same code colors (and by the jobs of a pool worker)"""
+    t = token_tables.get(colors)
+    if t is None:
+        load_pygments()
+        cols, default, _ = colors
+        by_type = {}
+        for k, sgr in cols:
+            tt = token
+            for n in k.split('.'):
+                tt = getattr(tt, n)
+            by_type[tt] = sgr
+
+        def resolve(ttype):
+            # the nearest type in code_hl (Keyword.Namespace -> Keyword), else C:
+            while ttype is not None and ttype not in by_type:
+                ttype = ttype.parent
+            return default if ttype is None else by_type[ttype]
+
+        t = token_tables[colors] = TokenColors(resolve)
+    return t
+
+
+def highlight_code(raw_code, lexer, sgr, reset, prefix=''):
+    """lexer: a pygments lexer or 'fast' or 'plain' (large_code), sgr: a
+    TokenColors"""
+    from . import formatter
+
+    opts = dict(sgr=sgr, reset=reset, prefix=prefix)
+    if lexer == 'plain':
+        return formatter.format_tokens([(formatter.token.Text, raw_code)], **opts)
+    if lexer == 'fast':
+        return formatter.format_tokens(formatter.fast_tokens(raw_code), **opts)
+    return formatter.highlight(raw_code, lexer, **opts)
+
+
+# ------------------------------------------------------- Parallel highlighting
+# the fenced code blocks of code heavy docs (from this many uncached ones) are
+# highlighted in a process pool, with at least hl_pool_min_cpus usable cpus.
+# None: never - no gain measured yet (bench.py parallel, on a 1 cpu box):
+hl_pool_min_cpus = None
+hl_pool_min_blocks = 40
+# workers, None: the usable cpus:
+hl_pool_size = None
+# by size:
+hl_pools, hl_pools_lock = {}, threading.Lock()
+
+
+def pool_size():
+    if hl_pool_size:
+        return hl_pool_size
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # pragma: no cover
+        return os.cpu_count() or 1
+
+
+def highlight_chunk(colors, jobs):
+    """pool worker: [(code, lexer name, prefix), ...] -> their ansi, in
+    colors (Renderer.code_colors)"""
+    sgr = code_token_table(colors)
+    return [highlight_code(code, lexers.get(name), sgr, colors[2], prefix) for code, name, prefix in jobs]
+
+
+def highlight_parallel(colors, jobs):
+    """Highlighted jobs, in order. Serial if the pool is not available"""
+    n = pool_size()
+    chunks = [jobs[i :: n * 4] for i in range(n * 4)]
+    try:
+        with hl_pools_lock:
+            pool = hl_pools.get(n)
+            if pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+
+                pool = hl_pools[n] = ProcessPoolExecutor(n)
+        res = list(pool.map(highlight_chunk, [colors] * len(chunks), chunks))
+    except (OSError, ImportError, RuntimeError):
+        # e.g. no semaphores on the platform or a broken pool:
+        with hl_pools_lock:
+            hl_pools.pop(n, None)
+        return highlight_chunk(colors, jobs)
+    # chunk i has jobs i, i + len(chunks), ...:
+    out = [None] * len(jobs)
+    for i, chunk in enumerate(res):
+        out[i :: len(chunks)] = chunk
+    return out
+
+
+# -------------------------------------------------------------------- Renderer
+# colors of these are precompiled, see compile_palette:
+palette_roles = (
+    'H1', 'H2', 'H3', 'H4', 'H5', 'H6', 'H7', 'H8', 'H9', 'H10',
+    'T', 'R', 'L', 'TL', 'C', 'CH1', 'CH2', 'CH3', 'CH4', 'CH5',
+)
+# what the config file and style rules may set, per renderer:
+config_keys = (
+    'BG', 'H1', 'H2', 'H3', 'H4', 'H5', 'H6', 'H7', 'H8', 'H9', 'H10',
+    'T', 'R', 'L', 'TL', 'C', 'CH1', 'CH2', 'CH3', 'CH4', 'CH5',
+    'code_hl', 'admons', 'left_indent', 'hr_sep', 'txt_block_cut',
+    'code_pref', 'list_pref', 'bquote_pref', 'hr_ends', 'def_lexer',
+    'guess_lexer', 'large_code_lines', 'large_code_chars', 'large_code_hl', 'large_code_fast_chars',
+    'show_links', 'THEME', 'md_sample',
+)
+
+
+class Renderer(object):
+    """
+    All settings of a render (theme, columns, link style, lexers, ...) as
+    instance state, the module globals are only the defaults.
+
+    Renderers can be reused and shared between threads, each thread gets its
+    own markdown instance, which is reset, not rebuilt, per render:
+
+        r = Renderer(theme='zenburn', cols=100)
+        ansi = r.render('# Hi')
+
+    theme=False: no theme loaded (module level col & co before any main call)
+    """
+
+    def __init__(
+        self,
+        theme=None,
+        c_theme=None,
+        cols=None,
+        c_def_lexer=None,
+        c_no_guess=None,
+        display_links=None,
+        header_nrs=False,
+        keep_bg=None,
+        link_style=None,
+        style_rules=None,
+        tab_length=4,
+        **kw
+    ):
+        ns = dict(globals())
+        ns['code_hl'], ns['admons'] = dict(code_hl), dict(admons)
+        style_rules = style_rules or set_bw_compat_rules(theme, c_theme)
+        exec_py_config_file(style_rules or '', ns)
+        for k in config_keys:
+            setattr(self, k, ns[k])
+
+        self.B16, self.reset_col = {}, reset_col
+        self.palette, self.marker_tables = {}, {}
+        self.is_random_theme = False
+        if theme is not False:
+            theme = theme or self.THEME
+            if not theme:
+                theme, self.is_random_theme = random_theme(), True
+            self.load_theme(theme)
+        self.theme, self.c_theme = theme, c_theme
+        # base colors of code, if differing:
+        self.c_B16 = None
+        if c_theme and theme is not False:
+            self.c_B16 = theme_pack.get(c_theme)
+            if not self.c_B16:
+                die('Code theme not found %s. Searched %s' % (c_theme, theme_pack.theme_dirs))
+
+        self.header_nr = parse_header_nrs(header_nrs) or dict(header_nr)
+        self.tab_length = int(tab_length or 4)
+        if c_def_lexer:
+            self.def_lexer = c_def_lexer
+        if cols:
+            self.term_columns = int(cols)
+        else:
+            probe_term_size()
+            self.term_columns = term_columns
+        self.term_rows = term_rows
+        if display_links:
+            self.show_links = 'i'
+        if link_style:  # rules
+            self.show_links = link_style
+        self.guess_lexer = not c_no_guess and self.guess_lexer
+        if not keep_bg and theme is not False:
+            self.set_background()
+        # built on first code block:
+        self.hl_colors = self.hl_fp = self.token_table = None
+        self.local = threading.local()
+
+    def load_theme(self, theme):
+        spec = theme_pack.get(theme)
+        if not spec:
+            die('Theme not found %s. Searched %s' % (theme, theme_pack.theme_dirs))
+        self.B16.update(spec)
+        self.compile_palette()
+
+    def set_background(self):
+        clr = self.to_bg_col(self.BG)
+        self.reset_col = esc + ('0;%sm' % clr if clr else '0m')
+        self.compile_palette()
+
+    def compile_palette(self):
+        """The ready SGR start sequences of all roles, for the theme in B16.
+        Other colors (e.g. of err) are added on first use"""
+        self.palette, self.marker_tables = {}, {}
+        self.hl_colors = self.hl_fp = self.token_table = None
+        for k in palette_roles:
+            self.sgr(getattr(self, k))
+
+    def markdown(self):
+        """The markdown instance of this thread, reset for a new document"""
+        md = getattr(self.local, 'md', None)
+        if md is None:
+            md = self.local.md = make_markdown(self.tab_length, self)
+        else:
+            md.reset()
+        return md
+
+    def render(
+        self,
+        md=None,
+        filename=None,
+        code_hilite=None,
+        do_html=None,
+        encoding='utf-8',
+        from_txt=None,
+        no_colors=None,
+        theme_info=None,
+        defer_code=None,
+        explain_slow=None,
+    ):
+        """defer_code: a list - code blocks are not highlighted but plain C,
+        appended as (plain, highlight function) to it. See monitor.
+        explain_slow: N - the N slowest top level blocks to stderr, with
+        their source lines and what they did (the costs in local.costs)"""
+        t0 = time.time()
+        md = md or read_md(filename, encoding, self)
+        if self.is_random_theme:
+            md += '\n' + self.col(self.theme, self.L)
+
+        MD = self.markdown()
+        self.local.source = (code_hilite, self.source_lang(md, filename)) if code_hilite else None
+        # nothing left of an earlier render, the html one runs AnsiPrinter, too:
+        self.local.large_blocks = 0
+        self.local.costs = self.local.highlighted = None
+        # html?
+        if do_html:
+            return MD.convert(md)
+
+        self.local.hl_deferred = defer_code
+        if explain_slow:
+            self.local.costs, self.local.setup_cost = [], self.setup_cost()
+        try:
+            # who wants html, here is our result:
+            ansi = convert_ansi(MD, md)
+
+            # The RAW html within source, incl. fenced code blocks:
+            # phs are numbered like this in the md, we replace back:
+            blocks = MD.htmlStash.rawHtmlBlocks
+            # deferred: all code blocks plain, nothing to prehighlight:
+            if defer_code is None:
+                self.local.highlighted = self.prehighlight(blocks)
+            ansi = self.unstash(ansi, blocks)
+        finally:
+            self.local.hl_deferred = self.local.highlighted = None
+
+        # don't want these: gone through the extension now:
+        # ansi = ansi.replace('```', '')
+
+        # sub part display (the -f feature)
+        if from_txt:
+            if not from_txt.split(':', 1)[0] in ansi:
+                # display from top then:
+                from_txt = ansi.strip()[1]
+            _ = (from_txt + ':%s' % (self.term_rows - 6)).split(':')
+            from_txt, mon_lines = _[:2]
+            mon_lines = int(mon_lines)
+            pre, post = ansi.split(from_txt, 1)
+            post = '\n'.join(post.split('\n')[:mon_lines])
+            pre = '\n'.join(pre.rsplit('\n', 2)[-2:])
+            ansi = '\n(...)%s%s%s' % (pre, from_txt, post)
+
+        if theme_info:
+            ansi += self.info()
+        ansi = self.set_hr_widths(ansi) + '\n'
+        ansi = self.add_bg_reset(ansi)
+        if no_colors:
+            return clean_ansi(ansi)
+        if self.BG:
+            # looks nicer when bg differs from term
+            ansi += '\x1b[0m\n'
+        if explain_slow:
+            self.explain(md, int(explain_slow), time.time() - t0)
+        return ansi
+
+    # explain_slow: costs of the top level blocks, timed in AnsiPrinter.run
+    # and unstash: {'kind', 'text', 'secs', 'notes', 'stashed', 'lines'}
+    def cost_start(self, el):
+        """A cost record for el, notes go there from now on"""
+        text = next((t for t in el.itertext() if t.strip()), '')
+        kind = el.tag
+        if el.tag in ('ul', 'ol', 'blockquote'):
+            kind += ', depth %s' % depth(el)
+        cost = {'kind': kind, 'text': text, 'secs': 0.0, 'notes': [], 't0': time.time()}
+        self.local.cost_notes = cost['notes']
+        return cost
+
+    def setup_cost(self):
+        """explain_slow: the one time imports (pygments, formatter, lexer
+        index, guess rules), timed here and not charged to the first code
+        block. Lexer modules imported later are added (see lexer)"""
+        t0, notes = time.time(), []
+        if load_pygments():
+            from . import formatter  # noqa: F401
+
+            lexers.load()
+            self.token_colors()
+            notes.append('pygments, formatter, lexer index')
+            if self.guess_lexer and self.guess_lexer != 'pygments':
+                guess.compile_rules()
+                notes.append('guess rules')
+        return {'secs': time.time() - t0, 'notes': notes}
+
+    def lexer(self, name):
+        """lexers.get(name), explain_slow: the import of its module timed
+        as setup"""
+        setup = getattr(self.local, 'setup_cost', None)
+        if setup is None or getattr(self.local, 'costs', None) is None or name in lexers.instances:
+            return lexers.get(name)
+        t0 = time.time()
+        lexer = lexers.get(name)
+        setup['secs'] += time.time() - t0
+        if lexer:
+            setup['notes'].append('lexer ' + type(lexer).__name__)
+        return lexer
+
+    def note(self, what):
+        """explain_slow: what the time of the current block went into"""
+        notes = getattr(self.local, 'cost_notes', None)
+        if notes is not None:
+            notes.append(what)
+
+    def explain(self, md, n, secs):
+        costs = self.local.costs
+        locate_costs(costs, md)
+        errout(
+            'mdv: the %s slowest of %s blocks, %.1fms of %.1fms total (the rest: imports, parsing, code pool):'
+            % (min(n, len(costs)), len(costs), sum(c['secs'] for c in costs) * 1000, secs * 1000)
+        )
+        setup = self.local.setup_cost
+        if setup['notes']:
+            errout('%9.2fms  %-13s %-16s %s' % (setup['secs'] * 1000, '', 'imports', ', '.join(setup['notes'])))
+        for c in sorted(costs, key=lambda c: -c['secs'])[:n]:
+            lines = 'lines %s-%s' % c['lines'] if c['lines'] else 'lines ?'
+            notes = ', '.join(sorted(set(c['notes']), key=c['notes'].index))
+            errout('%9.2fms  %-13s %-16s %s' % (c['secs'] * 1000, lines, c['kind'], notes))
+
+    def source_lang(self, md, filename=None):
+        """-C: the lexer of all code regions, by file name, else guessed once
+        from the whole source"""
+        lang = lexers.for_filename(filename) if filename else None
+        if not lang and self.guess_lexer:
+            lang = self.guessed(md, hlcache.key(md))
+        return lang or self.def_lexer
+
+    def unstash(self, ansi, blocks):
+        """Placeholders -> their rendered stash blocks, in one pass (like
+        markdown's RawHtmlPostprocessor). Each block is rendered once"""
+        if not blocks:
+            return ansi
+        tags, done = Tags(self), {}
+        costs = getattr(self.local, 'costs', None)
+        owner = {nr: c for c in costs or () for nr in c['stashed']}
+
+        def sub(m):
+            nr = int(m.group(1))
+            if nr >= len(blocks):
+                return m.group(0)
+            raw = done.get(nr)
+            if raw is None:
+                cost = owner.get(nr)
+                if cost is None:
+                    raw = done[nr] = self.stashed(blocks[nr], tags)
+                    return raw
+                # explain_slow: the stashed block's time is its top block's:
+                self.local.cost_notes, t0 = cost['notes'], time.time()
+                s0 = self.local.setup_cost['secs']
+                raw = done[nr] = self.stashed(blocks[nr], tags)
+                cost['secs'] += time.time() - t0 - (self.local.setup_cost['secs'] - s0)
+                self.local.cost_notes = None
+                if cost['kind'] == 'p' and cost['text'].strip() == m.group(0):
+                    # nothing but this block, the code or html is the text:
+                    html = unescape(blocks[nr])
+                    cost['kind'] = 'code' if html.startswith('<pre><code') else 'html'
+                    cost['text'] = html.split('>', 2)[-1] if cost['kind'] == 'code' else html
+            return raw
+
+        return placeholder_re().sub(sub, ansi)
+
+    def stashed(self, ph, tags):
+        raw = unescape(ph)
+        if raw[:3].lower() == '<br':
+            return '\n'
+        code = stashed_code(raw)
+        if code:
+            raw = tags.code(code[0], from_fenced_block=1, lang=code[1])
+        return raw
+
+    def prehighlight(self, blocks):
+        """Code heavy docs: {cache key: ansi} of their uncached fenced code
+        blocks (stashed, see unstash), highlighted in the pool. Else None"""
+        if not hl_pool_min_cpus or pool_size() < hl_pool_min_cpus:
+            return
+        codes = [c for c in (stashed_code(unescape(b)) for b in blocks) if c]
+        if len(codes) < hl_pool_min_blocks or not load_pygments():
+            return
+        # (fenced: the outest hir, see Tags.code)
+        jobs, prefix = {}, self.code_prefix(' ' * 2)
+        for code, lang in codes:
+            if self.large_code(code) or (lang and not lexers.known(lang)):
+                # fast enough / reported by style_ansi:
+                continue
+            name = self.lexer_name(code, lang)
+            k = hlcache.key(hlcache.key(code), name, self.hl_fingerprint(), prefix)
+            if k not in jobs and hlcache.get(k) is None:
+                jobs[k] = (code, name, prefix)
+        if len(jobs) < hl_pool_min_blocks:
+            return
+        keys = list(jobs)
+        return dict(zip(keys, highlight_parallel(self.code_colors(), [jobs[k] for k in keys])))
+
+    def style_ansi(self, raw_code, lang=None, prefix=''):
+        """actual code hilite, prefix starting each line. Cached by code,
+        lexer name, colors and prefix (hlcache) - the lexer is imported on a
+        miss only"""
+        deferred = getattr(self.local, 'hl_deferred', None)
+        if deferred is not None:
+            # plain now, highlighted by the caller (render's defer_code):
+            plain = self.highlight(raw_code, 'plain', prefix)
+            deferred.append((plain, partial(self.style_ansi, raw_code, lang, prefix)))
+            return plain
+        h = hlcache.key(raw_code)
+        large = self.large_code(raw_code)
+        name = large or self.lexer_name(raw_code, lang, h)
+        k = hlcache.key(h, name, self.hl_fingerprint(), prefix)
+        if large:
+            self.local.large_blocks = getattr(self.local, 'large_blocks', 0) + 1
+        done = getattr(self.local, 'highlighted', None) or {}
+        res = done.get(k)
+        if res is None:
+            res = hlcache.get(k)
+            if res is not None:
+                self.note('highlighting cached')
+                return res
+            lexer = large or self.lexer(name)
+            self.note(
+                '%s lines, %s' % (raw_code.count('\n') + 1, '%s highlighted (large)' % large
+                if large else 'lexed: ' + type(lexer).__name__)
+            )
+            res = self.highlight(raw_code, lexer, prefix)
+        else:
+            self.note('highlighted in the pool')
+        hlcache.put(k, res)
+        return res
+
+    def code_colors(self):
+        """The escape sequences highlighted code depends on, besides code and
+        lexer: of the token types in code_hl, of other code and the reset.
+        What the pool workers get of us"""
+        if self.hl_colors is None:
+            cols = sorted((k, self.code_sgr(getattr(self, v))) for k, v in self.code_hl.items())
+            self.hl_colors = (tuple(cols), self.code_sgr(self.C), self.reset_col)
+        return self.hl_colors
+
+    def hl_fingerprint(self):
+        """code_colors and the pygments version, for the hlcache keys"""
+        if self.hl_fp is None:
+            from pygments import __version__
+
+            cols, c, reset = self.code_colors()
+            self.hl_fp = repr((__version__, list(cols), c, reset))
+        return self.hl_fp
+
+    def token_colors(self):
+        """The compiled token type -> escape sequence table, shared by the
+        renderers with the same code colors"""
+        if self.token_table is None:
+            self.token_table = code_token_table(self.code_colors())
+        return self.token_table
+
+    def token_sgr(self, ttype):
+        return self.token_colors()[ttype]
+
+    def lexer_name(self, raw_code, lang=None, h=None):
+        """The name of the lexer for raw_code, from the lexer index, i.e.
+        w/o importing it"""
+        if lang:
+            if lexers.known(lang):
+                return lexers.normalize(lang)
+            err('no lexer for alias %r found' % lexers.normalize(lang))
+
+        if self.guess_lexer:
+            name = self.guessed(raw_code, h or hlcache.key(raw_code))
+            if name and lexers.known(name):
+                return name
+
+        for l in self.def_lexer, 'yaml', 'python', 'c':
+            if lexers.known(l):
+                return l
+            # OUR def_lexer (python) was overridden,but not found.
+            # still we should not fail. lets use yaml. or python:
+
+    def guessed(self, raw_code, h):
+        """The guessed lexer alias, '' if none. Once per code (h its hash),
+        guesses cut short by guess.budget only once per process"""
+        k = hlcache.key('guess', str(self.guess_lexer), str(guess.version), h)
+        alias = hlcache.get(k)
+        if alias is None:
+            self.note('lexer guessed' + (' by pygments' if self.guess_lexer == 'pygments' else ''))
+            final = True
+            if self.guess_lexer == 'pygments':
+                try:
+                    # takes a long time!
+                    alias = pyg_guess_lexer(raw_code).aliases[0]
+                except:
+                    alias = ''
+            else:
+                alias, final = guess.result(raw_code)
+                alias = alias or ''
+            hlcache.put(k, alias, disk=final)
+        return alias
+
+    def code_prefix(self, ind):
+        """starting each code line"""
+        return '%s%s ' % (ind, self.low(self.code_pref))
+
+    def large_code(self, raw_code):
+        """large_code_hl ('fast' or 'plain') when raw_code is over the limits,
+        lexing it would take seconds. Else None. Over large_code_fast_chars
+        'plain' - fast_tokens is linear, but ~0.4us a char"""
+        n, m = self.large_code_lines, self.large_code_chars
+        if (m and len(raw_code) > m) or (n and raw_code.count('\n') >= n):
+            f = self.large_code_fast_chars
+            if self.large_code_hl == 'plain' or (f and len(raw_code) > f):
+                return 'plain'
+            return 'fast'
+
+    def highlight(self, raw_code, lexer, prefix=''):
+        """lexer: a pygments lexer or 'fast' or 'plain' (large_code)"""
+        return highlight_code(raw_code, lexer, self.token_colors(), self.reset_col, prefix)
+
+    def info(self):
+        """The -i lines: themes and what was not lexed"""
+        l = ['theme: %s, code theme: %s' % (self.theme, self.c_theme or self.theme)]
+        n = getattr(self.local, 'large_blocks', 0)
+        if n:
+            l.append(
+                'large code blocks (> %s lines or %s chars), %s highlighted: %s'
+                % (self.large_code_lines, self.large_code_chars, self.large_code_hl, n)
+            )
+            if self.large_code_hl == 'fast' and self.large_code_fast_chars:
+                l[-1] += ' (plain over %s chars)' % self.large_code_fast_chars
+        return ''.join('\n' + self.low(s) for s in l)
+
+    def low(self, s):
+        # shorthand
+        return self.col(s, self.L)
+
+    def plain(self, s, **kw):
+        # when a tag is not found:
+        return self.col(s, self.T)
+
+    # ------------------------------------------------- Text Termcols Adaptions
+
+    def rewrap(self, el, t, ind, pref):
+        """t wrapped to the columns left (wrap.fill: textwrap's, measuring
+        the visible width)"""
+        cols = max(self.term_columns - len(ind + pref), 5)
+        if el.tag == 'code' or columns(t) <= cols:
+            return t
+
+        # this is a code replacement marker of markdown.py. Don't split the
+        # replacement marker:
+        if t.startswith('\x02') and t.endswith('\x03'):
+            return t
+
+        # markers and escape sequences (link urls) are zero width:
+        return wrap.fill(t, cols, invisible=invisible_markers, closing=''.join(marker_ends))
+
+    def split_blocks(self, lines, widths, cols, part_fmter=None):
+        """splits the lines of a (large) table vertically into parts fitting
+        cols, between its columns (of widths) - within one only when it is
+        wider than a part. Cut by visible columns, colors kept"""
+        sep = len(table.sep)
+        # first part full width, others a bit indented:
+        room, scols = cols, cols - 2
+        spans, start, end, x = [], 0, 0, 0
+        for w in widths:
+            if x + w - start > room:
+                if end > start:
+                    spans.append((start, end))
+                    start, room = x, scols
+                # too wide for a part on its own:
+                while x + w - start > room:
+                    spans.append((start, start + room))
+                    start, room = start + room, scols
+            end = x + w
+            x = end + sep
+        spans.append((start, end))
+
+        blocks = []
+        # the txt_block_cut in low makes the whole secondary tables
+        # low. which i find a feature:
+        # if you don't want it remove the col(.., L)
+        cut = ' ' + self.col(self.txt_block_cut, self.L, no_reset=1)
+        for nr, (start, end) in enumerate(spans):
+            tpart = [ansi_slice(line, start, end) for line in lines]
+            if nr:
+                tpart = [cut + line for line in tpart]
+            if part_fmter:
+                part_fmter(tpart)
+            blocks.append('\n'.join(tpart))
+        t = '\n'.join(blocks)
+        return '\n%s\n' % t
+
+    def inline(self, el, links=None, outer=''):
+        """el's content (w/o its tail) as text with our inline markers, in one
+        walk over the subtree. Returns the urls of the links (for the 'it'
+        link style, they get numbered) and the text.
+        outer: the start marker of the style el is in, re-opened after the
+        end of a nested one (col restores the base color at ends)"""
+        links = [] if links is None else links
+        parts = [el.text or '']
+        for c in el:
+            tag = c.tag
+            if tag == 'br':
+                parts.append('\n')
+            elif tag in inline_markers and not c.attrib:
+                start, end = inline_markers[tag]
+                parts += [start, self.inline(c, links, start)[1], end + outer]
+            elif tag == 'a' and 'href' in c.keys():
+                parts.append(self.link(c, links, outer))
+            elif tag in ('ul', 'ol') and el.tag == 'li' and c is el[-1]:
+                # nested list, formatted on its own, the li formatter cuts here:
+                parts.append('<%s>' % tag)
+                break
+            else:
+                # nothing we support (e.g. img): shown as html, with its tail:
+                parts.append(unescape(elstr(c)))
+                continue
+            parts.append(c.tail or '')
+        return links, ''.join(parts)
+
+    def link(self, a, links, outer=''):
+        # indicating link formatting start:
+        cur = link_start + to_unescaped(self.inline(a, links, link_start)[1]) + link_end + outer
+        if self.show_links == 'i':
+            cur += self.low('(%s)' % a.get('href', ''))
+        elif self.show_links != 'h':  # inline table (it)
+            # we build a link list, add the number like ① :
+            cur += '%s ' % unichr(link_start_ord + len(links))
+            links.append(to_unescaped(a.get('href', '')))
+        return cur
+
+    def add_bg_reset(self, result):
+        _ = 'MDV_NO_ANSI_CURSOR_MVMT'
+        if not self.BG or envget(_, '').lower() in {'true', '1'}:
+            return result
+        lines, cols = result.splitlines(), self.term_columns
+        dl = len(lines)
+        if dl < self.term_rows:
+            # the rows they take, wide chars and overlong lines wrap:
+            dl = sum(max(1, -(-ansi_width(l) // cols)) for l in lines)
+        r = min(self.term_rows, dl)
+        ret = '\n' + self.reset_col + '\n'.join([' ' * self.term_columns for i in range(r)])
+        ret += esc + str(r) + 'A'
+        return ret + result
+
+    def set_hr_widths(self, result):
+        """
+        We want the hrs indented by hirarchy...
+        A bit 2 much effort to calc, maybe just fixed with 10
+        style seps would have been enough visually:
+        ◈────────────◈
+        """
+        if hr_marker not in result:
+            return result
+        # set all hrs to max width of text, one pass for both:
+        mw = 0
+        lines, hrs = result.split('\n'), []
+        for nr, line in enumerate(lines):
+            if hr_marker in line:
+                hrs.append(nr)
+            elif len(line) > mw or not is_ascii(line):
+                l = ansi_width(line)
+                if l > mw:
+                    mw = l
+
+        mw = min(self.term_columns, mw)
+        for nr in hrs:
+            # pos of hr marker is indent, derives full width:
+            # (more indent = less '-'):
+            hr = lines[nr]
+            ind = ansi_width(hr.split(hr_marker, 1)[0])
+            lines[nr] = hr.replace(hr_marker, self.hr_sep * (mw - 2 * ind))
+        return '\n'.join(lines)
+
+    # ------------------------------------------------------------ color system
+    def col(self, s, c, no_reset=0):
+        """
+        print col('foo', 124) -> red 'foo' on the terminal
+        c = color, s the value to colorize"""
+        reset = self.reset_col
+        if no_reset:
+            reset = ''
+        table = self.marker_tables.get(c)
+        if table is None:
+            if not markers_re.search(s):
+                # (the roles may not be resolvable, e.g. for errors w/o theme)
+                return self.sgr(c) + s + reset
+            table = self.marker_table(c)
+        # precomputed sequences. Nested markup is re-opened after inner ends
+        # (see inline), i.e. ends always restore c:
+        for start, start_seq, end, end_seq in table:
+            if start in s:
+                s = s.replace(start, start_seq).replace(end, end_seq)
+        return self.sgr(c) + s + reset
+
+    def marker_table(self, c):
+        """The escape sequences of our markers within color c"""
+        try:
+            return self.marker_tables[c]
+        except KeyError:
+            pass
+        t = self.marker_tables[c] = [
+            (
+                m,
+                self.sgr(getattr(self, role)) + (esc + '4m' if ul else ''),
+                end,
+                (esc + '24m' if ul else '') + self.sgr(c),
+            )
+            for m, (end, role, ul) in marker_styles.items()
+        ]
+        return t
+
+    def sgr(self, c):
+        """color -> the escape sequence starting it"""
+        try:
+            return self.palette[c]
+        except KeyError:
+            pass
+        self.palette[c] = s = self.make_sgr(c)
+        return s
+
+    def make_sgr(self, c, B16=None):
+        """B16: resolving base colors, default the theme's"""
+        if isinstance(c, tuple):
+            if len(c) == 2:
+                # 1,124 -> bold and fg
+                c1 = '%s;%s' % (mod(c[0]), self.to_col(c[1], B16=B16))
+            elif len(c) == 3:
+                c1 = '%s;%s;%s' % (
+                    mod(c[0]),
+                    self.to_col(c[1], B16=B16),
+                    self.to_col(c[2], _fb='4', B16=B16),
+                )
+            else:
+                c1 = str(c)
+        else:
+            c1 = self.to_col(c, B16=B16)
+        return '%s%sm' % (esc, c1)
+
+    def code_sgr(self, c):
+        """sgr, colors of the code theme (c_theme), if we have one"""
+        if not self.c_B16:
+            return self.sgr(c)
+        return self.make_sgr(c, self.c_B16)
+
+    def to_col(self, c, _fb='3', B16=None):
+        if isinstance(c, int):
+            if not c:
+                return ''
+            return _fb + '8;5;%s' % c
+        if c[0] == '#':
+            return _fb + '8;2;%s;%s;%s' % hex_to_rgb(c[1:])
+        if c[0:4] == 'base':
+            c = (B16 or self.B16)[c]
+            if not c:
+                return ''
+            if isinstance(c, tuple):
+                # the theme pack has them resolved already:
+                return _fb + '8;2;%s;%s;%s' % c
+            try:
+                return _fb + '8;2;%s;%s;%s' % hex_to_rgb(c)
+            except:
+                return _fb + '8;5;%s' % c
+        return c   # given as ansi
+
+    def to_bg_col(self, c):
+        return self.to_col(c, _fb='4')
+
+
+# renderers of main, by their settings:
+renderers = {}
+# the one of the last main call, for the module level col, low, ...:
+renderer = None
+
+
+def current():
+    global renderer
+    if renderer is None:
+        renderer = Renderer(theme=False)
+    return renderer
+
+
+def get_renderer(**kw):
+    """A cached renderer for these settings. Dropped when the config file
+    changes. Random theme ones are not cached, we want a new theme per call"""
+    global renderer
+    try:
+        mt = os.stat(py_config_file).st_mtime
+    except OSError:
+        mt = 0
+    key = repr((sorted(kw.items()), mt, term_columns, term_rows))
+    r = renderers.get(key)
+    if r is None:
+        r = Renderer(**kw)
+        if not r.is_random_theme:
+            if len(renderers) > 50:
+                renderers.clear()
+            renderers[key] = r
+    renderer = r
+    return r
+
+
 def main(
     md=None,
     filename=None,
@@ -1294,6 +2088,8 @@ def main(
     tab_length=4,
     theme=None,
     theme_info=None,
+    defer_code=None,
+    explain_slow=None,
     **kw,
 ):
     """md is markdown string. alternatively we use filename and read"""
@@ -1303,131 +2099,111 @@ def main(
     # https://github.com/axiros/terminal_markdown_viewer/issues/39
     # If you hate it then switch it off but don't blame me on unicode errs.
     True if no_change_defenc else fix_py2_default_encoding()
-    theme_dirs = _ = mydir + '/b16', mydir + '/5color'
-    style_rules = style_rules or set_bw_compat_rules(_[1], theme, c_theme)
-    exec_py_config_file(style_rules or '')
-    md = md or read_md(filename, encoding)
-    theme = theme or THEME
-    if not theme:
-        theme = random_theme(theme_dirs)
-        md += '\n' + col(theme, L)
-
-    load_theme(theme_dirs, theme)
-    parse_header_nrs(header_nrs)
-
-    tab_length = tab_length or 4
-    global def_lexer
-    if c_def_lexer:
-        def_lexer = c_def_lexer
-    args = locals()
-    # style rolers requested?
-    global term_columns
-    if cols:
-        term_columns = int(cols)
-
-    global show_links
-    if display_links:
-        show_links = 'i'
-    if link_style:  # rules
-        show_links = link_style
-
-    global guess_lexer
-    guess_lexer = not c_no_guess
-
-    # if not theme == False:
-    #     set_theme(theme, theme_info=theme_info)
-    #
-    #     if not c_theme:
-    #         c_theme = theme or 'default'
-    #
-    #     if c_theme == 'None':
-    #         c_theme = None
-    #
-    #     if c_theme:
-    #         set_theme(c_theme, for_code=1, theme_info=theme_info)
-    #
-    #     if c_theme:
-    #         # info:
-    #         if not have_pygments:
-    #             errout(col('No pygments, can not analyze code for hilite', R))
-    if not keep_bg:
-        set_background()
-
-    build_hl_by_token()
-    # Create an instance of the Markdown class with the new extension
-    MD = markdown.Markdown(
-        tab_length=int(tab_length),
-        extensions=[
-            AnsiPrintExtension(),
-            TableExtension(),
-            fenced_code.FencedCodeExtension(),
-        ],
+    r = get_renderer(
+        theme=theme,
+        c_theme=c_theme,
+        cols=cols,
+        c_def_lexer=c_def_lexer,
+        c_no_guess=c_no_guess,
+        display_links=display_links,
+        header_nrs=header_nrs,
+        keep_bg=keep_bg,
+        link_style=link_style,
+        style_rules=style_rules,
+        tab_length=tab_length,
+    )
+    return r.render(
+        md,
+        filename=filename,
+        code_hilite=code_hilite,
+        do_html=do_html,
+        encoding=encoding,
+        from_txt=from_txt,
+        no_colors=no_colors,
+        theme_info=theme_info,
+        defer_code=defer_code,
+        explain_slow=explain_slow,
     )
-
-    if code_hilite:
-        md = do_code_hilite(md, code_hilite)
-    the_html = MD.convert(md)
-    reset_cur_header_state()
-    # print the_html
-    # html?
-    if do_html:
-        return the_html
-
-    # who wants html, here is our result:
-    ansi = MD.ansi
-
-    # The RAW html within source, incl. fenced code blocks:
-    # phs are numbered like this in the md, we replace back:
-    PH = markdown.util.HTML_PLACEHOLDER
-    stash = MD.htmlStash
-    nr = -1
-    tags = Tags()
-    for ph in stash.rawHtmlBlocks:
-        nr += 1
-        raw = unescape(ph)
-        if raw[:3].lower() == '<br':
-            raw = '\n'
-        pre = '<pre><code'
-        if raw.startswith(pre):
-            _, raw = raw.split(pre, 1)
-            if 'class="' in raw:
-                # language:
-                lang = raw.split('class="', 1)[1].split('"')[0]
-            else:
-                lang = ''
-            raw = raw.split('>', 1)[1].rsplit('</code>', 1)[0]
-            raw = tags.code(raw.strip(), from_fenced_block=1, lang=lang)
-        ansi = ansi.replace(PH % nr, raw)
-
-    # don't want these: gone through the extension now:
-    # ansi = ansi.replace('```', '')
-
-    # sub part display (the -f feature)
-    if from_txt:
-        if not from_txt.split(':', 1)[0] in ansi:
-            # display from top then:
-            from_txt = ansi.strip()[1]
-        _ = (from_txt + ':%s' % (term_rows - 6)).split(':')
-        from_txt, mon_lines = _[:2]
-        mon_lines = int(mon_lines)
-        pre, post = ansi.split(from_txt, 1)
-        post = '\n'.join(post.split('\n')[:mon_lines])
-        pre = '\n'.join(pre.rsplit('\n', 2)[-2:])
-        ansi = '\n(...)%s%s%s' % (pre, from_txt, post)
-
-    ansi = set_hr_widths(ansi) + '\n'
-    ansi = add_bg_reset(ansi)
-    if no_colors:
-        return clean_ansi(ansi)
-    if BG:
-        # looks nicer when bg differs from term
-        ansi += '\x1b[0m\n'
-    return ansi
 
 
 # Following just file monitors, not really core feature so the prettyfier:
 # but sometimes good to have at hand:
 # ---------------------------------------------------------------- File Monitor
+sgr_re = re.compile(r'\x1b\[[\d;]*m')
+
+
+class Repainter(threading.Thread):
+    """Monitor mode: the doc was printed with its code blocks plain (jobs:
+    [(plain, highlight function)], see render's defer_code). Highlights them
+    in the background and overwrites their lines which are still on screen,
+    with the cursor moved up and back. The highlighted lines have the same
+    visible text, i.e. wrap the same way.
+
+    Blocks changed later on in the render (e.g. rewrapped in lists) are not
+    found in the output and stay plain. cancel() before printing again.
+
+    size: (columns, rows) of the terminal, default: probed when run - not
+    the render's -c columns, the cursor moves by the real ones"""
+
+    def __init__(self, printed, jobs, out=None, size=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.printed, self.jobs, self.out = printed, jobs, out or sys.stdout
+        self.size = size
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.join()
+
+    def run(self):
+        lines = self.printed.split('\n')
+        cols, self.rows = self.size or get_terminal_size()
+        if not cols:
+            cols, self.rows = 80, term_rows
+        # how far up the cursor (in the last, empty line) each line starts,
+        # wrapped lines taking more rows:
+        up, n = [0] * len(lines), 0
+        for i in range(len(lines) - 2, -1, -1):
+            n += max(1, -(-ansi_width(lines[i]) // cols))
+            up[i] = n
+        done = set()
+        for plain, highlight in self.jobs:
+            if self.cancelled:
+                return
+            if plain not in done:
+                done.add(plain)
+                self.repaint(plain, highlight().split('\n'), up)
+
+    def repaint(self, plain, hl_lines, up):
+        printed, out = self.printed, []
+        pos = printed.find(plain)
+        while pos > -1:
+            start = printed.count('\n', 0, pos)
+            # the block's first line may have stuff before it:
+            at = printed.rfind('\n', 0, pos) + 1
+            x = ansi_width(printed[at:pos])
+            at = pos
+            for i, l in enumerate(hl_lines):
+                if up[start + i] < self.rows:
+                    # save cursor, up, to column, colors there, restore:
+                    move = '%s%sA\r' % (esc, up[start + i])
+                    if x and not i:
+                        move += '%s%sC' % (esc, x)
+                    out.append('\x1b7' + move + self.sgr_at(at) + l + '\x1b8')
+                at = printed.find('\n', at) + 1
+            pos = printed.find(plain, pos + len(plain))
+        if out and not self.cancelled:
+            self.out.write(''.join(out))
+            self.out.flush()
+
+    def sgr_at(self, pos):
+        """The color sequences in effect at pos: from the last reset on"""
+        printed = self.printed
+        i = printed.rfind(esc + '0', 0, pos)
+        return ''.join(sgr_re.findall(printed, max(i, 0), pos))
+
+
 def monitor(args):
     """file monitor mode"""
     filename = args.get('filename')
@@ -1436,6 +2212,9 @@ def monitor(args):
         raise SystemExit
     last_err = ''
     last_stat = 0
+    painter = None
+    # plain code first, highlighted on screen when ready:
+    defer = sys.stdout.isatty() and not args.get('no_colors')
     while True:
         if not exists(filename):
             last_err = 'File %s not found. Will continue trying.' % filename
@@ -1443,8 +2222,15 @@ def monitor(args):
             try:
                 stat = os.stat(filename)[8]
                 if stat != last_stat:
-                    parsed = main(**args)
+                    if painter:
+                        painter.cancel()
+                    jobs = [] if defer else None
+                    parsed = main(defer_code=jobs, **args)
                     print(str(parsed))
+                    if jobs:
+                        # print adds the last line break:
+                        painter = Repainter(str(parsed) + '\n', jobs)
+                        painter.start()
                     last_stat = stat
                 last_err = ''
             except Exception as ex:
@@ -1622,9 +2408,6 @@ def merge(a, b):
     return c
 
 
-B16 = {}
-
-
 def write_file(fn, s):
     os.makedirs(os.path.dirname(fn), exist_ok=True)
     with open(fn, 'w') as fd:
@@ -1658,23 +2441,22 @@ def exit_help():
 
 
 def list_themes():
-    def show(fn):
-        spec = loads(readfile(fn))
-        n = fn.rsplit('/', 1)[1].split('.json')[0]
-        B16.clear()
-        B16.update(spec)
-        set_background()
-        s = reset_col
+    r = Renderer(theme=False)
+
+    def show(n, spec):
+        r.B16.clear()
+        r.B16.update(spec)
+        r.set_background()
+        s = r.reset_col
         for l in range(1, 8):
             t = 'H%s' % l
-            s += col(t, globals()[t]) + ' '
-        print(reset_col)
+            s += r.col(t, getattr(r, t)) + ' '
+        print(r.reset_col)
         print(s + '   ' + n)
 
     for D in 'b16', '5color', 'b16':
-        d = mydir + '/' + D
-        for f in sorted([i for i in os.listdir(d) if i.endswith('.json')]):
-            show(d + '/' + f)
+        for n in theme_pack.names(D):
+            show(n, theme_pack.get(n, D))
 
 
 def run():
@@ -1690,20 +2472,39 @@ def run():
         kw.update(load_config(filename=fn))
     kw.update(kw1)
     _ = kw.get
+    if _('explain_slow'):
+        try:
+            kw['explain_slow'] = int(_('explain_slow'))
+        except ValueError:
+            die('-E/--explain-slow: not a number of blocks: %s' % _('explain_slow'))
     if _('theme') == 'all':   # or _('c_theme') == 'all':
         return list_themes()
 
     if _('theme_browser'):
+        # it lists the themes via our theme pack (mdv.themes.main):
+        os.environ['MDV_PYTHON'] = sys.executable
         args = ' '.join([f'{k}' for k in sys.argv[1:]])
         t = os.popen(mydir + '/theme_browser.sh ' + args).read().strip()
         if t:
             kw['theme'] = t
+    if kw.get('daemon'):
+        from .daemon import serve
+
+        return serve()
     if kw.get('monitor_file'):
         monitor(kw)
     elif kw.get('monitor_dir'):
         monitor_dir(kw)
     else:
-        print(main(**kw) if PY3 else str(main(**kw)))
+        res = None
+        # (the daemon's stderr is not ours)
+        if daemon.is_up() and not kw.get('explain_slow'):
+            if not kw.get('cols'):
+                probe_term_size()
+            res = daemon.render(kw, term=(term_columns, term_rows))
+        if res is None:
+            res = main(**kw)
+        print(res if PY3 else str(res))
 
 
 # --------------------------------------------------------------------------------------------------- color system
@@ -1715,66 +2516,20 @@ def mod(c):
     return str(c)
 
 
+# module level: with the renderer of the last main call (see current)
 def col(s, c, no_reset=0):
     """
     print col('foo', 124) -> red 'foo' on the terminal
     c = color, s the value to colorize"""
-    reset = reset_col
-    if no_reset:
-        reset = ''
-    for _strt, _end, _col in (
-        (code_start, code_end, H2),
-        (stng_start, stng_end, H2),
-        (link_start, link_end, H2),
-        (emph_start, emph_end, H3),
-    ):
-        if _strt in s:
-            uon, uoff = '', ''
-            if _strt == link_start:
-                uon, uoff = esc + '4m', esc + '24m'
-            s = s.replace(_strt, col('', _col, no_reset=1) + uon)
-            s = s.replace(_end, uoff + col('', c, no_reset=1))
-
-    if isinstance(c, tuple):
-        if len(c) == 2:
-            # 1,124 -> bold and fg
-            c = '%s;%s' % (mod(c[0]), to_col(c[1]))
-        elif len(c) == 3:
-            c = '%s;%s;%s' % (mod(c[0]), to_col(c[1]), to_bg_col(c[2]))
-    else:
-        c = to_col(c)
-    s = '%s%sm%s%s' % (esc, c, s, reset)
-    return s
+    return current().col(s, c, no_reset)
 
 
 def to_col(c, _fb='3'):
-    if isinstance(c, int):
-        if not c:
-            return ''
-        return _fb + '8;5;%s' % c
-    if c[0] == '#':
-        return _fb + '8;2;%s;%s;%s' % hex_to_rgb(c[1:])
-    if c[0:4] == 'base':
-        c = B16[c]
-        if not c:
-            return ''
-        try:
-            return _fb + '8;2;%s;%s;%s' % hex_to_rgb(c)
-        except:
-            return _fb + '8;5;%s' % c
-    return c   # given as ansi
+    return current().to_col(c, _fb)
 
 
 def to_bg_col(c):
-    return to_col(c, _fb='4')
-
-
-def set_background():
-    clr = to_bg_col(BG)
-    if clr:
-        global reset_col
-        reset_col = esc + '0;%sm' % clr
-        # print(reset_col)
+    return current().to_bg_col(c)
 
 
 hex_to_rgb = lambda h: tuple(int(h[i : i + 2], 16) for i in (0, 2, 4))
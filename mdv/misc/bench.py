@@ -0,0 +1,558 @@
+#!/usr/bin/env python
+"""
+mdv benchmarks, from a checkout:
+
+    ./mdv/misc/bench.py              # all
+    ./mdv/misc/bench.py daemon [..]  # some
+
+Corpus is the markdown in tests/files.
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(os.path.dirname(here))
+sys.path.insert(0, root)
+
+from mdv import markdownviewer as mv
+
+benches = []
+
+
+def bench(f):
+    benches.append(f)
+    return f
+
+
+def corpus():
+    d = os.path.join(root, 'tests', 'files')
+    fns = sorted(f for f in os.listdir(d) if f.endswith('.md'))
+    return [(f, mv.readfile(os.path.join(d, f))) for f in fns]
+
+
+def best(f, count=5, *a, **kw):
+    """best of count runs in ms"""
+    r = []
+    for i in range(count):
+        t0 = time.time()
+        f(*a, **kw)
+        r.append(time.time() - t0)
+    return min(r) * 1000
+
+
+def report(name, ms, ref=None):
+    if ref:
+        print('%-40s %9.2fms  (%.1fx)' % (name, ms, ref / ms))
+    else:
+        print('%-40s %9.2fms' % (name, ms))
+
+
+@bench
+def daemon():
+    """cold CLI runs vs. CLI runs served by a warm daemon"""
+    sock = '/tmp/mdv_bench_%s.sock' % os.getpid()
+    env = dict(os.environ, MDV_SOCKET=sock, PYTHONPATH=root)
+    fn = os.path.join(root, 'README.md')
+    cli = [sys.executable, '-c', 'import mdv; mdv.run()', fn, '-c', '80']
+    run = lambda **e: subprocess.call(
+        cli, env=dict(env, **e), stdout=subprocess.DEVNULL
+    )
+    cold = best(run, MDV_NO_DAEMON='1')
+    report('cold cli (README.md)', cold)
+    srv = subprocess.Popen(cli[:3] + ['-D'], env=env, stderr=subprocess.PIPE)
+    try:
+        while not os.path.exists(sock):
+            time.sleep(0.05)
+        report('daemon served cli (README.md)', best(run), cold)
+    finally:
+        srv.terminate()
+        srv.wait()
+
+
+@bench
+def renderer():
+    """per call overhead: new renderer per call vs. a reused one"""
+    kw = dict(theme='729.8953', cols=80, c_no_guess=True, keep_bg=True)
+    small = '# Hi\n\nsome *text*\n'
+    docs = [md for f, md in corpus()]
+    fresh = best(lambda: mv.Renderer(**kw).render(small), 20)
+    report('fresh renderer, small doc', fresh)
+    r = mv.Renderer(**kw)
+    report('reused renderer, small doc', best(r.render, 20, small), fresh)
+    fresh = best(lambda: [mv.Renderer(**kw).render(md) for md in docs])
+    report('fresh renderer, corpus', fresh)
+    reused = best(lambda: [r.render(md) for md in docs])
+    report('reused renderer, corpus', reused, fresh)
+
+    def threaded(n=4):
+        import threading
+
+        ts = [
+            threading.Thread(target=lambda: [r.render(md) for md in docs])
+            for i in range(n)
+        ]
+        [t.start() for t in ts]
+        [t.join() for t in ts]
+
+    report('shared renderer, 4 threads x corpus', best(threaded))
+
+
+@bench
+def ansi_only():
+    """ansi conversion stopping after the tree processors vs. full convert"""
+    import tracemalloc
+
+    r = mv.Renderer(theme='729.8953', cols=80, c_no_guess=True, keep_bg=True)
+    docs = [md for f, md in corpus()]
+    big = '\n\n'.join(docs * 20)
+    for name, mds in ('corpus', docs), ('corpus x 20, one doc', [big]):
+        MD = r.markdown()
+        full = best(lambda: [MD.reset().convert(md) for md in mds])
+        report('full convert, %s' % name, full)
+        ansi = best(lambda: [mv.convert_ansi(MD.reset(), md) for md in mds])
+        report('ansi only, %s' % name, ansi, full)
+    for name, f in ('full convert', MD.convert), ('ansi only', mv.convert_ansi):
+        tracemalloc.start()
+        f(MD.reset(), big) if f is mv.convert_ansi else f(big)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('%-40s %9.1fMB peak' % (name + ', corpus x 20', peak / 1e6))
+
+
+@bench
+def inline():
+    """inline content extraction, nested lists of growing depth"""
+    r = mv.Renderer(theme='729.8953', cols=200, c_no_guess=True, keep_bg=True)
+    ref = None
+    for depth in 10, 20, 40:
+        md = '\n'.join(
+            '    ' * i + '- item *%s* with a [link](#l%s)' % (i, i) for i in range(depth)
+        )
+        ms = best(r.render, 5, md)
+        ref = ref or ms / 10
+        report('depth %s, per level' % depth, ms / depth, ref)
+
+
+@bench
+def stash():
+    """htmlStash placeholder substitution, growing number of stashed blocks"""
+    r = mv.Renderer(theme='729.8953', cols=80, c_no_guess=True, keep_bg=True)
+    ref = None
+    for n in 500, 1000, 2000, 4000:
+        md = '\n\n'.join('para %s with <b>inline html</b>' % i for i in range(n))
+        ms = best(r.render, 3, md)
+        ref = ref or ms / 500
+        report('%s blocks, per block' % n, ms / n, ref)
+
+
+@bench
+def hrs():
+    """hr widths, changelog like docs with a growing number of hrs"""
+    r = mv.Renderer(theme='729.8953', cols=80, c_no_guess=True, keep_bg=True)
+    entry = '## 1.%s\n\n- fixed *this*\n- added `that`\n\n----\n'
+    ref = None
+    for n in 250, 500, 1000, 2000:
+        ms = best(r.render, 3, ''.join(entry % i for i in range(n)))
+        ref = ref or ms / 250
+        report('%s hrs, per entry' % n, ms / n, ref)
+
+
+@bench
+def palette():
+    """col() on theme roles and a code heavy doc (col per pygments token)"""
+    r = mv.Renderer(theme='zenburn', cols=80, c_no_guess=True)
+    roles = [r.H1, r.H2, r.T, r.L, r.C, r.CH1, r.CH3, r.CH4]
+
+    def cols(n=20000):
+        for i in range(n):
+            for c in roles:
+                r.col('token', c)
+
+    report('160k col() calls', best(cols, 3))
+    import textwrap
+
+    from mdv import hlcache
+
+    md = '```python\n%s\n```\n' % mv.readfile(textwrap.__file__)
+    lims = hlcache.mem_max, hlcache.disk_max_bytes
+    hlcache.mem_max, hlcache.disk_max_bytes = 0, 0
+    report('textwrap.py as code block, uncached', best(r.render, 3, md))
+    hlcache.mem_max, hlcache.disk_max_bytes = lims
+
+
+@bench
+def markers():
+    """col() on paragraphs with inline markup markers"""
+    r = mv.Renderer(theme='zenburn', cols=80, c_no_guess=True)
+    words = 'some %sbold%s and %semph%s and %scode%s in a %slink%s here. ' % (
+        mv.stng_start, mv.stng_end, mv.emph_start, mv.emph_end,
+        mv.code_start, mv.code_end, mv.link_start, mv.link_end,
+    )
+    for n in 1, 20:
+        p = words * n
+        report('paragraph of %s sentences, x1000' % n, best(lambda: [r.col(p, r.T) for i in range(1000)]))
+    p = 'plain text ' * 10
+    report('no markers, x10000', best(lambda: [r.col(p, r.T) for i in range(10000)]))
+
+
+@bench
+def lexer_index():
+    """lexer per fence name: pygments get_lexer_by_name vs. mdv.lexers"""
+    from pygments.lexers import get_lexer_by_name
+    from mdv import lexers
+
+    names = ['python', 'sh', 'js', 'yaml', 'c'] * 20
+
+    def pyg():
+        for n in names:
+            get_lexer_by_name(n)
+
+    def unknown():
+        try:
+            get_lexer_by_name('no-such-lexer')
+        except Exception:
+            pass
+
+    ref = best(pyg)
+    report('100 fences, get_lexer_by_name', ref)
+    report('100 fences, mdv.lexers.get', best(lambda: [lexers.get(n) for n in names]), ref)
+    t0 = time.time()
+    unknown()
+    report('unknown name, first (plugin scan)', (time.time() - t0) * 1000)
+    report('unknown name, then', best(unknown))
+    report('unknown name, mdv.lexers.get', best(lexers.get, 5, 'no-such-lexer'))
+    t = 'import mdv.lexers as l; l.load()'
+    cold = lambda: subprocess.call([sys.executable, '-c', t], cwd=root)
+    report('process: load the alias map (from disk)', best(cold))
+
+
+@bench
+def guessing():
+    """untagged code blocks: pygments guess_lexer vs. mdv.guess"""
+    from pygments.lexers import guess_lexer
+    from mdv import guess
+
+    d = os.path.join(root, 'tests', 'files', 'guess')
+    samples = [(f.split('.')[0], mv.readfile(os.path.join(d, f))) for f in sorted(os.listdir(d))]
+    cold = lambda t: subprocess.call([sys.executable, '-c', t], cwd=root)
+    ref = best(cold, 3, 'from pygments.lexers import guess_lexer as g; g("x = 1")')
+    report('process: first guess, pygments', ref)
+    report('process: first guess, mdv', best(cold, 3, 'import mdv.guess as g; g.guess("x = 1")'), ref)
+    names = lambda l: l.aliases if l else ()
+    for name, f in (
+        ('pygments', lambda c: names(guess_lexer(c))),
+        ('mdv', lambda c: [guess.guess(c)]),
+    ):
+        hits = sum(lang in f(code) for lang, code in samples)
+        print('%-40s %6s/%s right' % (name + ' guesses', hits, len(samples)))
+    ref = best(lambda: [guess_lexer(c) for l, c in samples])
+    report('%s samples, pygments' % len(samples), ref)
+    report('%s samples, mdv' % len(samples), best(lambda: [guess.guess(c) for l, c in samples]), ref)
+    import textwrap
+
+    code = mv.readfile(textwrap.__file__)
+    ref = best(guess_lexer, 5, code)
+    report('textwrap.py, pygments', ref)
+    report('textwrap.py, mdv', best(guess.guess, 5, code), ref)
+
+
+@bench
+def parallel():
+    """code heavy docs (python blocks, uncached): serial vs. the highlighting
+    pool - hl_pool_min_cpus/hl_pool_min_blocks go where it gains"""
+    import random
+    import textwrap
+    from mdv import hlcache
+
+    src = mv.readfile(textwrap.__file__).split('\n')
+    random.seed(1)
+    blocks = []
+    for i in range(300):
+        s = random.randrange(len(src) - 15)
+        blocks.append('## f%s\n\nAbout `f%s`:\n\n```python\n%s\n```\n' % (i, i, '\n'.join(src[s : s + 15])))
+    r = mv.Renderer(theme='zenburn', cols=80, keep_bg=True)
+    cpus = mv.pool_size()
+    print('%-40s %9s' % ('usable cpus', cpus))
+    lims = hlcache.mem_max, hlcache.disk_max_bytes
+    hlcache.mem_max = hlcache.disk_max_bytes = 0
+    mins = mv.hl_pool_min_cpus, mv.hl_pool_min_blocks
+    try:
+        for nb in 40, 100, 300:
+            md = '\n'.join(blocks[:nb])
+            mv.hl_pool_min_cpus = None
+            ref = best(r.render, 3, md)
+            report('%s blocks, serial' % nb, ref)
+            mv.hl_pool_min_cpus, mv.hl_pool_min_blocks = 1, 1
+            for n in sorted(set((1, 2, cpus))):
+                mv.hl_pool_size = n
+                r.render(md)  # pool startup
+                report('%s blocks, pool of %s' % (nb, n), best(r.render, 3, md), ref)
+    finally:
+        mv.hl_pool_size = None
+        mv.hl_pool_min_cpus, mv.hl_pool_min_blocks = mins
+        hlcache.mem_max, hlcache.disk_max_bytes = lims
+
+
+@bench
+def hl_cache():
+    """code block heavy doc: uncached vs. memory and disk cache hits"""
+    import tempfile
+    from mdv import hlcache
+
+    os.environ['MDV_CACHE_DIR'] = tempfile.mkdtemp()
+    md = '\n'.join('```\npip install mdv\nmdv -t %s README.md\n```\n\n```python\n%s\n```\n' % (i, mv.__doc__[:2000]) for i in range(30))
+    r = mv.Renderer(theme='zenburn', cols=80)
+
+    def uncached():
+        lims = hlcache.mem_max, hlcache.disk_max_bytes
+        hlcache.mem_max, hlcache.disk_max_bytes = 0, 0
+        r.render(md)
+        hlcache.mem_max, hlcache.disk_max_bytes = lims
+
+    def disk():
+        hlcache.clear()
+        r.render(md)
+
+    ref = best(uncached)
+    report('60 blocks, uncached', ref)
+    r.render(md)
+    report('60 blocks, from disk', best(disk), ref)
+    report('60 blocks, from memory', best(r.render, 5, md), ref)
+    print('%-40s %s' % ('stats', hlcache.stats))
+    shutil.rmtree(os.environ.pop('MDV_CACHE_DIR'))
+
+
+@bench
+def code_throughput():
+    """large source files as code blocks, uncached highlighting"""
+    import argparse
+    import textwrap
+    import io
+    import typing
+    from mdv import hlcache, lexers
+
+    try:
+        from mdv import formatter as fmt
+    except ImportError:  # older mdv
+        fmt = None
+
+    r = mv.Renderer(theme='zenburn', cols=100, c_no_guess=True)
+    lims = hlcache.mem_max, hlcache.disk_max_bytes
+    hlcache.mem_max, hlcache.disk_max_bytes = 0, 0
+    for m in textwrap, argparse, typing:
+        src = mv.readfile(m.__file__)
+        md = '```python\n%s\n```\n' % src
+        ms = best(r.render, 3, md)
+        out = len(r.render(md))
+        print('%-40s %9.2fms %6.2fMB/s  %5.1fx output' % (
+            os.path.basename(m.__file__), ms, len(src) / ms / 1000, out / float(len(src))))
+        if fmt:
+            toks = list(lexers.get('python').get_tokens(src))
+            f = lambda: fmt.AnsiFormatter(sgr=r.token_colors(), prefix='  | ').format(toks, io.StringIO())
+            ms = best(f)
+            print('%-40s %9.2fms %6.2fMB/s' % ('  formatting only', ms, len(src) / ms / 1000))
+    hlcache.mem_max, hlcache.disk_max_bytes = lims
+
+
+@bench
+def large_code():
+    """20000 line log as code block: lexed vs large_code_hl fast / plain"""
+    from mdv import hlcache
+
+    r = mv.Renderer(theme='zenburn', cols=100, c_no_guess=True)
+    lims = hlcache.mem_max, hlcache.disk_max_bytes
+    hlcache.mem_max, hlcache.disk_max_bytes = 0, 0
+    log = '\n'.join(
+        '2024-01-01 12:00:%02d INFO worker-%d "GET /api/v1/items?id=%d" 200 %.3f # ok'
+        % (i % 60, i % 8, i, i / 7.0)
+        for i in range(20000)
+    )
+    md = '```python\n%s\n```\n' % log
+    modes = [('lexed', 0, 'fast', 0)]
+    if hasattr(r, 'large_code'):
+        modes += [('fast', 5000, 'fast', 0), ('plain', 5000, 'plain', 0)]
+    if hasattr(r, 'large_code_fast_chars'):
+        modes += [('fast, plain over the limit', 5000, 'fast', mv.large_code_fast_chars)]
+    for name, lines, how, fast_chars in modes:
+        r.large_code_lines, r.large_code_chars, r.large_code_hl = lines, 0, how
+        r.large_code_fast_chars = fast_chars
+        report(name, best(r.render, 3, md))
+    hlcache.mem_max, hlcache.disk_max_bytes = lims
+    if hasattr(r, 'large_code_fast_chars'):
+        # fast_tokens is ~0.4us a char, the limit keeps it at ~40ms:
+        code = log[: mv.large_code_fast_chars]
+        report('highlighting only, plain, %s chars' % len(code), best(r.highlight, 3, code, 'plain'))
+        ms, limit = best(r.highlight, 3, code, 'fast'), 60
+        report('highlighting only, fast, %s chars' % len(code), ms)
+        print('%-40s %9s' % ('check: under %sms' % limit, 'ok' if ms < limit else 'FAILED'))
+
+
+@bench
+def first_screen():
+    """monitor mode, 300 uncached python blocks: full render vs. plain code
+    first (defer_code), then the highlighting"""
+    import random
+    import textwrap
+    from mdv import hlcache
+
+    src = mv.readfile(textwrap.__file__).split('\n')
+    random.seed(2)
+    blocks = []
+    for i in range(300):
+        s = random.randrange(len(src) - 15)
+        blocks.append('## f%s\n\nAbout `f%s`:\n\n```\n%s\n```\n' % (i, i, '\n'.join(src[s : s + 15])))
+    md = '\n'.join(blocks)
+    r = mv.Renderer(theme='zenburn', cols=80, keep_bg=True)
+    lims = hlcache.mem_max, hlcache.disk_max_bytes
+    hlcache.mem_max, hlcache.disk_max_bytes = 0, 0
+    mv.hl_pool_size = 1
+    ref = best(r.render, 3, md)
+    report('full render', ref)
+    try:
+        jobs = []
+        report('first screen, code plain', best(r.render, 3, md, defer_code=jobs), ref)
+        report('  then highlighting', best(lambda: [f() for p, f in jobs[-300:]], 3))
+    except TypeError:  # older mdv
+        pass
+    mv.hl_pool_size = None
+    hlcache.mem_max, hlcache.disk_max_bytes = lims
+
+
+@bench
+def source_mode():
+    """-C all: modules with markdown docstrings every 20 lines, highlighting
+    cached (e.g. monitor refreshes): the cost of the code / doc splitting"""
+    import textwrap
+
+    src = mv.readfile(textwrap.__file__).split('\n')
+    r = mv.Renderer(theme='zenburn', cols=100)
+    for n in 500, 2500:
+        parts = []
+        for i in range(n):
+            parts.append('\n'.join(src[(i * 20) % 400 :][:20]))
+            parts.append('"""_\n## Part %s\n\nSee `f%s`, *all* of it.\n"""' % (i, i))
+        md = '\n'.join(parts)
+        kw = dict(filename='x.py', code_hilite='all')
+        r.render(md, **kw)
+        report('%s lines, file name given' % (n * 24), best(r.render, 3, md, **kw))
+        kw.pop('filename')
+        r.render(md, **kw)
+        report('%s lines, lexer guessed' % (n * 24), best(r.render, 3, md, **kw))
+
+
+@bench
+def ansi_core():
+    """escape sequence scanning on rendered lines (the README, zenburn)"""
+    import re
+
+    try:
+        from mdv import ansi
+    except ImportError:  # older mdv
+        return print('(no mdv.ansi)')
+
+    lines = mv.Renderer(theme='zenburn', cols=100).render(mv.readfile(os.path.join(root, 'README.md'))).split('\n')
+    old_re = re.compile(r'\x1b[^m]*m')
+    old_tab = re.compile(r'\x1b\[\d*m|\x1b\[\d*\;\d*\;\d*m')
+    n = len(lines)
+    report('%s lines, strip: regex per line' % n, best(lambda: [old_re.sub('', l) for l in lines]))
+    report('  ansi.strip', best(lambda: [ansi.strip(l) for l in lines]))
+    report('width: tabulate (misses truecolor)', best(lambda: [len(old_tab.sub('', l)) for l in lines]))
+    ansi.width.cache_clear()
+    report('  ansi.width, first call', best(lambda: [ansi.width(l) for l in lines], 1))
+    report('  ansi.width, memoized', best(lambda: [ansi.width(l) for l in lines]))
+    report('slice 10 columns from 20 on', best(lambda: [ansi.slice(l, 20, 30) for l in lines]))
+
+@bench
+def wrapping():
+    """rewrap of long paragraphs: textwrap vs. mdv.wrap"""
+    import textwrap
+
+    try:
+        from mdv import wrap
+    except ImportError:  # older mdv
+        return print('(no mdv.wrap)')
+    words = 'lorem ipsum dolor-sit amet, consectetur adipiscing elit sed do'.split()
+    plain = ' '.join(words[i % len(words)] for i in range(20000))
+    start, end = list(mv.marker_styles.items())[0]
+    # every 7th word emphasized, as the inline patterns mark it:
+    marked = ' '.join(start + w + end[0] if i % 7 == 0 else w for i, w in enumerate(plain.split()))
+    inv, closing = mv.invisible_markers, ''.join(mv.marker_ends)
+    for name, t in ('plain', plain), ('with markers', marked):
+        n = len(t.split())
+        ref = best(textwrap.fill, 3, t, 80)
+        report('%s words %s: textwrap.fill' % (n, name), ref)
+        report('  wrap.fill', best(wrap.fill, 3, t, 80, inv, closing), ref)
+
+@bench
+def widths():
+    """terminal columns: ASCII docs pay nothing, CJK lines a table lookup"""
+    try:
+        from mdv.widths import columns
+    except ImportError:  # older mdv
+        columns = None
+    r = mv.Renderer(theme='zenburn', cols=100)
+    md = mv.readfile(os.path.join(root, 'README.md')) * 5
+    r.render(md)
+    report('README x 5, render', best(r.render, 5, md))
+    if columns is None:
+        return print('(no mdv.widths)')
+    lines = r.render(md).split('\n')
+    ascii_lines = [mv.clean_ansi(l) for l in lines if max(l or ' ') < '\x80']
+    cjk = ['日本語の文章はとても長いので、この行は折り返されるべきです %s' % i for i in range(len(ascii_lines))]
+    n = len(ascii_lines)
+    ref = best(lambda: [len(l) for l in ascii_lines])
+    report('%s ascii lines: len' % n, ref)
+    report('  widths.columns', best(lambda: [columns(l) for l in ascii_lines]))
+    report('%s CJK lines: widths.columns' % n, best(lambda: [columns(l) for l in cjk]))
+
+@bench
+def tables():
+    """table layout of rendered cells: tabulate vs. mdv.table, and whole docs"""
+    from mdv.tabulate import tabulate
+
+    try:
+        from mdv import table
+    except ImportError:  # older mdv
+        table = None
+    r = mv.Renderer(theme='zenburn', cols=200)
+    head = '| host | ip | `role` | up | note |\n|---|---|:-:|--:|---|\n'
+    row = '| **h%s** | 10.0.%s.1 | `web` | %s | [doc](http://x/%s) |\n'
+    for n in 10, 1000, 50000:
+        cell = lambda v: r.col(mv.stng_start + v + mv.stng_end, r.T)
+        rows = [['host', 'ip', 'role', 'up', 'note']]
+        rows += [[cell('h%s' % i), '10.0.%s.1' % i, cell('web'), str(i), cell('doc')] for i in range(n)]
+        count = 1 if n > 1000 else 5
+        ref = best(tabulate, count, rows)
+        report('%s rows: tabulate' % n, ref)
+        if table:
+            report('  table.layout', best(table.layout, count, rows, ['', '', 'center', 'right']), ref)
+        if n <= 1000:
+            md = head + ''.join(row % (i, i, i, i) for i in range(n))
+            report('  render', best(r.render, count, md))
+
+@bench
+def wide_tables():
+    """tables wider than the terminal, split into parts"""
+    r = mv.Renderer(theme='zenburn', cols=40)
+    head = '| host | address | `role` | uptime | notes |\n|---|---|---|--:|---|\n'
+    row = '| **host%s** | 10.0.%s.1 | `web` | %s | [doc](http://x/%s) and some words |\n'
+    for n in 10, 1000:
+        md = head + ''.join(row % (i, i, i, i) for i in range(n))
+        r.render(md)
+        report('%s rows, 40 cols' % n, best(r.render, 3, md))
+
+
+def main(names):
+    for f in benches:
+        if not names or f.__name__ in names:
+            print('\n%s: %s' % (f.__name__, f.__doc__))
+            f()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
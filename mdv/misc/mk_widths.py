@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Writes mdv/widths_table.py, the terminal columns of the code points, from
+this python's unicodedata:
+
+- 0: combining marks (Mn, Me), format chars (Cf, but the soft hyphen) and
+  the Hangul medial vowels and final consonants (they join the syllable)
+- 2: East Asian Wide and Fullwidth (CJK, Hangul syllables, emoji presentation),
+  the unassigned ones of the CJK planes, too
+- 1: all others
+
+Stored as the starts of the ranges with their width, for bisect.
+"""
+from __future__ import print_function
+
+import os
+import unicodedata
+
+here = os.path.dirname(os.path.abspath(__file__))
+fn = os.path.join(os.path.dirname(here), 'widths_table.py')
+
+
+def width(cp):
+    c = chr(cp)
+    cat = unicodedata.category(c)
+    if cat in ('Mn', 'Me') or (cat == 'Cf' and cp != 0xAD) or 0x1160 <= cp <= 0x11FF:
+        return 0
+    if cat == 'Cn':
+        # (east_asian_width is no help for the unassigned ones)
+        return 2 if 0x20000 <= cp <= 0x3FFFD else 1
+    return 2 if unicodedata.east_asian_width(c) in ('W', 'F') else 1
+
+
+def ranges():
+    starts, widths, last = [], [], None
+    for cp in range(0x110000):
+        w = width(cp)
+        if w != last:
+            starts.append(cp)
+            widths.append(w)
+            last = w
+    return starts, widths
+
+
+def rows(values, fmt, n):
+    values = [fmt % v for v in values]
+    return '\n'.join('    ' + ', '.join(values[i : i + n]) + ',' for i in range(0, len(values), n))
+
+
+def main():
+    starts, widths = ranges()
+    src = [
+        '# generated by mdv/misc/mk_widths.py, unicodedata %s - do not edit' % unicodedata.unidata_version,
+        '# code points starts[i] to starts[i+1] - 1 are widths[i] columns wide:',
+        'starts = (\n%s\n)' % rows(starts, '0x%x', 10),
+        'widths = (\n%s\n)' % rows(widths, '%d', 30),
+        '',
+    ]
+    with open(fn, 'w') as fd:
+        fd.write('\n'.join(src))
+    print('%s ranges -> %s' % (len(starts), fn))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Markdown tables laid out, the way tabulate's 'simple' format did it for us
+(w/o headers, i.e. the header row is a row like the others):
+
+    ────  ─────  ───
+    Item  Value  Qty
+    Pipe  $1     234
+    ────  ─────  ───
+
+Cells are rendered already (colors, markers resolved), their visible width
+is computed once. No type guessing, no number formatting: the alignment is
+the one given in the markdown (`:---:`, `---:`), left by default.
+Lines are right stripped, multi line cells joined by spaces.
+"""
+from .ansi import strip
+from .widths import columns
+
+sep, border = '  ', '─'
+
+
+def align(cell):
+    """The markdown alignment of a th or td element"""
+    a = cell.get('align') or cell.get('style', '')
+    return a.replace('text-align:', '').strip(' ;')
+
+
+def layout(rows, aligns=()):
+    """Returns the column widths and the lines of the table"""
+    n = max([len(row) for row in rows] or [0])
+    cells, widths = [], [0] * n
+    for row in rows:
+        row = [c.replace('\n', ' ').strip() for c in row]
+        row += [''] * (n - len(row))
+        ws = [columns(strip(c)) for c in row]
+        cells.append((row, ws))
+        widths = list(map(max, widths, ws))
+    aligns = (list(aligns) + [''] * n)[:n]
+    line = sep.join(border * w for w in widths).rstrip()
+    lines = [line]
+    for row, ws in cells:
+        parts = []
+        for c, cw, w, a in zip(row, ws, widths, aligns):
+            pad = w - cw
+            if a == 'right':
+                c = ' ' * pad + c
+            elif a == 'center':
+                c = ' ' * (pad // 2) + c + ' ' * (pad - pad // 2)
+            else:
+                c += ' ' * pad
+            parts.append(c)
+        lines.append(sep.join(parts).rstrip())
+    lines.append(line)
+    return widths, lines
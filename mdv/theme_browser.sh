@@ -8,12 +8,11 @@ function ensure_fzf {
     # TODO: ask for install using gear/binenv...
 }
 function all_styles {
-    builtin cd "$here"
+    builtin cd "$here/.."
     local t && t="$(have_theme)"
     test -z "$t" || echo -e "have\t$t"
-    for k in b16 5color; do
-        /usr/bin/ls "$k" | grep json | sed -e "s/\.json//g" | sed -e "s/^/$k\t/g"
-    done
+    # from the theme pack, "<dir>\t<name>" lines:
+    "${MDV_PYTHON:-python3}" -c "from mdv import themes; themes.main()"
 }
 function write_config {
     mkdir -p "$HOME/.config/mdv"
@@ -0,0 +1,132 @@
+"""
+Theme pack: All json themes of b16/ and 5color/ in one file, colors
+pre-resolved (hex strings to rgb tuples), loaded with one read.
+
+Theme lookup, random selection and listing go through its index, no
+directory scans, no per theme json parsing.
+
+The pack lives in the cache dir and is rebuilt when a theme dir or one of its
+json files is newer than it, i.e. when theme files got added, removed,
+replaced or edited in place (one scandir per dir, ~2ms).
+
+    # "<dir>\\t<name>" lines, for theme_browser.sh:
+    python -c "from mdv import themes; themes.main()"
+"""
+import io
+import json
+import os
+import zlib
+
+from .cache import cache_dir, write_atomic
+
+mydir = os.path.dirname(os.path.realpath(__file__))
+# order is precedence, should a name be in both:
+theme_dirs = ('b16', '5color')
+version = 1
+packs = {}
+
+
+def resolve(v):
+    """'3f3f3f' -> (63, 63, 63). 256 color ints and false stay"""
+    if isinstance(v, str) and len(v) == 6:
+        try:
+            return tuple(int(v[i : i + 2], 16) for i in (0, 2, 4))
+        except ValueError:
+            pass
+    return v
+
+
+def build(src=mydir):
+    dirs = {}
+    for d in theme_dirs:
+        specs = dirs[d] = {}
+        for fn in sorted(os.listdir(os.path.join(src, d))):
+            if not fn.endswith('.json'):
+                continue
+            with io.open(os.path.join(src, d, fn), encoding='utf-8') as fd:
+                spec = json.load(fd)
+            specs[fn[:-5]] = dict(
+                (k, resolve(v) if k != 'scheme' else v)
+                for k, v in spec.items()
+                if k.startswith('base') or k == 'scheme'
+            )
+    return {'version': version, 'src': src, 'dirs': dirs}
+
+
+def pack_file(src=mydir):
+    h = zlib.crc32(src.encode('utf-8')) & 0xFFFFFFFF
+    return os.path.join(cache_dir(), 'themes.%08x.json' % h)
+
+
+def is_fresh(fn, src):
+    try:
+        mt = os.stat(fn).st_mtime
+        for d in theme_dirs:
+            d = os.path.join(src, d)
+            if os.stat(d).st_mtime > mt:
+                return False
+            # edits in place don't touch the dir:
+            with os.scandir(d) as entries:
+                for e in entries:
+                    if e.name.endswith('.json') and e.stat().st_mtime > mt:
+                        return False
+        return True
+    except OSError:
+        return False
+
+
+def load(src=mydir):
+    """The pack, with 'index': name -> spec over all theme dirs"""
+    pack = packs.get(src)
+    if pack:
+        return pack
+    fn = pack_file(src)
+    if is_fresh(fn, src):
+        try:
+            with io.open(fn, encoding='utf-8') as fd:
+                pack = json.loads(fd.read())
+        except (IOError, OSError, ValueError):
+            pack = None
+    if not pack or pack.get('version') != version or pack.get('src') != src:
+        pack = build(src)
+        # not writable? Then we just build it every time:
+        write_atomic(fn, json.dumps(pack, separators=(',', ':')))
+    pack['index'] = index = {}
+    for d in reversed(theme_dirs):
+        index.update(pack['dirs'][d])
+    packs[src] = pack
+    return pack
+
+
+def to_spec(spec):
+    # json gave us lists:
+    return dict((k, tuple(v) if isinstance(v, list) else v) for k, v in spec.items())
+
+
+def get(name, d=None):
+    """The theme's base16 spec or None. d: restrict to one theme dir"""
+    pack = load()
+    spec = (pack['dirs'][d] if d else pack['index']).get(str(name))
+    return to_spec(spec) if spec else None
+
+
+def names(d=None):
+    """All theme names (sorted) of one theme dir or all"""
+    pack = load()
+    return list(pack['dirs'][d]) if d else sorted(pack['index'])
+
+
+def random_name():
+    from random import choice
+
+    return choice(names())
+
+
+def main():
+    for d in theme_dirs:
+        for n in names(d):
+            print('%s\t%s' % (d, n))
+
+
+if __name__ == '__main__':
+    main()
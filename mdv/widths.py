@@ -0,0 +1,60 @@
+"""
+Terminal columns of text: CJK and emoji take 2, combining marks 0, the
+rest 1 - the ranges in widths_table.py (generated by misc/mk_widths.py),
+looked up by bisect, once per distinct char.
+
+Text below U+0300 (ASCII, Latin-1, ...) is all narrow: len(), no lookup.
+
+- columns(s): the width of s (no escape sequences in it, see ansi.width)
+- char(c): the width of c
+- clip(s, start, end): the chars of s in columns start to end, a wide char
+  cut by a boundary becomes spaces (the column count stays right)
+"""
+from bisect import bisect_right
+
+from .widths_table import starts, widths
+
+first_non_narrow = '\u0300'
+cache = {}
+
+
+try:
+    is_ascii = str.isascii  # O(1), py3.7+
+except AttributeError:
+    def is_ascii(s):
+        return not s or max(s) < '\x80'
+
+
+def char(c):
+    w = cache.get(c)
+    if w is None:
+        w = cache[c] = widths[bisect_right(starts, ord(c)) - 1]
+    return w
+
+
+def columns(s):
+    if is_ascii(s) or max(s) < first_non_narrow:
+        return len(s)
+    try:
+        return sum(map(cache.__getitem__, s))
+    except KeyError:
+        return sum(map(char, s))
+
+
+def clip(s, start=0, end=None):
+    """s[start:end], by columns"""
+    if is_ascii(s) or max(s) < first_non_narrow:
+        return s[start:end]
+    out, col = [], 0
+    for c in s:
+        w = char(c)
+        if end is not None and col + w > end:
+            if col < end:
+                out.append(' ' * (end - col))
+            break
+        if col >= start:
+            out.append(c)
+        elif col + w > start:
+            out.append(' ' * (col + w - start))
+        col += w
+    return ''.join(out)
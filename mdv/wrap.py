@@ -0,0 +1,113 @@
+"""
+Line wrapping of text which still contains zero width stuff: our inline
+markers (see markdownviewer, they become colors later) and escape sequences
+(e.g. the low colored urls of link style 'i').
+
+Results are textwrap.fill's (dedented, stripped, whitespace normalized,
+hyphenated words broken at their hyphens, too long words cut) - with the
+widths measured visible:
+
+- escape sequences and the `invisible` chars count zero, wide chars (CJK,
+  emoji) two, see widths
+- too long words are cut by visible columns, never within an escape
+  sequence. Of the invisible chars the `closing` ones stay with the text
+  before the cut, the others go with the text after it.
+
+One pass over the words, textwrap's hyphenation regex only applied to the
+words not fitting.
+"""
+import re
+import textwrap
+
+from .ansi import csi_re
+from .widths import char, columns, is_ascii
+
+spaces_re = re.compile('( +)')
+# textwrap's replace_whitespace:
+whitespace = dict.fromkeys(map(ord, '\t\n\x0b\x0c\r'), ' ')
+
+
+def measure(invisible=''):
+    """The visible width function for text with the invisible chars"""
+    drop = dict.fromkeys(map(ord, invisible))
+
+    def width(s):
+        if is_ascii(s) and s.isprintable():
+            return len(s)
+        if '\x1b' in s:
+            s = csi_re.sub('', s)
+        return columns(s.translate(drop))
+
+    return width
+
+
+def cut(s, n, invisible='', closing='', force=False):
+    """s split after n visible columns, at least one char when force (the
+    start of a line: a wide char on a width 1 line)"""
+    i, vis, l = 0, 0, len(s)
+    while i < l and vis < n:
+        c = s[i]
+        if c == '\x1b':
+            m = csi_re.match(s, i)
+            if m:
+                i = m.end()
+                continue
+        if c not in invisible:
+            w = char(c) if c > '~' else 1
+            if vis + w > n and (vis or not force):
+                # a wide one, not fitting
+                break
+            vis += w
+        i += 1
+    while i < l and s[i] in closing:
+        i += 1
+    return s[:i], s[i:]
+
+
+def fill(text, width, invisible='', closing=''):
+    """textwrap.fill(textwrap.dedent(text).strip(), width), visible widths"""
+    if '\n' in text:
+        text = textwrap.dedent(text)
+    text = text.strip().expandtabs().translate(whitespace)
+    w = measure(invisible)
+    width = max(width, 1)
+    chunks = spaces_re.split(text)
+    chunks.reverse()
+    lines = []
+    while chunks:
+        cur, cur_len = [], 0
+        if lines and not chunks[-1].strip():
+            del chunks[-1]
+        while chunks:
+            c = chunks[-1]
+            l = w(c)
+            if cur_len + l <= width:
+                cur.append(chunks.pop())
+                cur_len += l
+                continue
+            if '-' in c and c.strip():
+                # textwrap's chunks of a hyphenated word:
+                parts = textwrap.TextWrapper.wordsep_re.findall(c)
+                if len(parts) > 1:
+                    chunks[-1:] = parts[::-1]
+                    continue
+            break
+        if chunks and w(chunks[-1]) > width:
+            # too long, cut (at a hyphen, if there is one):
+            c = chunks[-1]
+            space_left = width - cur_len
+            head, tail = cut(c, space_left, invisible, closing, force=not cur_len)
+            hyphen = head.rfind('-')
+            if 0 < hyphen < len(head) - 1 and head[:hyphen].strip('-'):
+                head, tail = c[: hyphen + 1], c[hyphen + 1 :]
+            if cur_len and space_left and not w(head):
+                # a wide first char not fitting: the word starts the next line
+                pass
+            else:
+                cur.append(head)
+                chunks[-1] = tail
+        if cur and not cur[-1].strip():
+            del cur[-1]
+        if cur:
+            lines.append(''.join(cur))
+    return '\n'.join(lines)
@@ -0,0 +1,13 @@
+# coding: utf-8
+"""
+The tests' mdv cache (highlighted code, theme pack, lexer index) is a fresh
+temporary dir, not the user's: stale entries there can't make a test pass or
+fail. Tests with a cache of their own restore this one after.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+
+cache = os.environ['MDV_CACHE_DIR'] = tempfile.mkdtemp(prefix='mdv_tests_')
+atexit.register(shutil.rmtree, cache, True)
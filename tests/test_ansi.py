@@ -0,0 +1,30 @@
+# coding: utf-8
+from unittest import TestCase, main
+
+from mdv import ansi
+
+R, red, tc, bg = '\x1b[0m', '\x1b[31m', '\x1b[38;2;1;2;3m', '\x1b[0;48;2;5;5;5m'
+s = 'ab' + red + 'cd' + R + 'ef' + tc + 'gh'
+
+
+class TestAnsi(TestCase):
+    def test_strip_width(self):
+        self.assertEqual(ansi.strip(s), 'abcdefgh')
+        self.assertEqual(ansi.width(s), 8)
+        # cursor moves (add_bg_reset) are invisible, too:
+        self.assertEqual(ansi.width('\x1b[22A' + bg + 'x m'), 3)
+
+    def test_slice(self):
+        self.assertEqual(ansi.slice(s, 0, 2), 'ab')
+        self.assertEqual(ansi.slice(s, 1, 3), 'b' + red + 'c' + R)
+        # colors set before start repeated:
+        self.assertEqual(ansi.slice(s, 3, 6), red + 'd' + R + 'ef')
+        self.assertEqual(ansi.slice(s, 7), R + tc + 'h' + R)
+        self.assertEqual(ansi.slice(bg + 'xy' + red + 'z', 1), bg + 'y' + red + 'z' + R)
+        for a in range(9):
+            for b in range(a, 9):
+                self.assertEqual(ansi.strip(ansi.slice(s, a, b)), 'abcdefgh'[a:b])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# coding: utf-8
+import os
+import subprocess
+import sys
+import time
+from unittest import TestCase, main, skipUnless
+
+import mdv
+from mdv import daemon
+
+here = os.path.abspath(__file__).rsplit('/', 1)[0]
+fn = os.path.join(here, 'files', 'test_fenced.md')
+
+
+@skipUnless(hasattr(os, 'fork'), 'needs fork and unix sockets')
+class TestDaemon(TestCase):
+    def setUp(self):
+        self.sock = '/tmp/mdv_test_%s.sock' % os.getpid()
+        os.environ['MDV_SOCKET'] = self.sock
+        env = dict(os.environ, PYTHONPATH=here.rsplit('/', 1)[0])
+        cmd = [sys.executable, '-c', 'import mdv; mdv.run()', '-D']
+        self.srv = subprocess.Popen(cmd, env=env, stderr=subprocess.PIPE)
+        for i in range(300):
+            if os.path.exists(self.sock):
+                break
+            time.sleep(0.05)
+        else:
+            self.srv.kill()
+            err = self.srv.communicate()[1].decode('utf-8', 'replace')
+            os.environ.pop('MDV_SOCKET')
+            self.fail('daemon socket %s did not appear within 15s:\n%s' % (self.sock, err))
+
+    def tearDown(self):
+        self.srv.terminate()
+        self.srv.wait()
+        os.environ.pop('MDV_SOCKET')
+        self.assertFalse(os.path.exists(self.sock))
+
+    def test_same_as_in_process(self):
+        kw = dict(filename=fn, theme=729.8953, c_no_guess=True, cols=40)
+        res = daemon.render(kw, term=(80, 30))
+        self.assertEqual(res, mdv.main(**kw))
+        # no state leaks from one render into the next:
+        daemon.render(dict(kw, link_style='h', style_rules='H1=1'), (80, 30))
+        self.assertEqual(daemon.render(kw, term=(80, 30)), res)
+
+    def test_fallback(self):
+        self.assertIsNone(daemon.render({'filename': '/not/there'}, (80, 30)))
+        os.environ['MDV_NO_DAEMON'] = '1'
+        try:
+            self.assertIsNone(daemon.render({'filename': fn}, (80, 30)))
+        finally:
+            os.environ.pop('MDV_NO_DAEMON')
+
+
+
+class TestSocketCheck(TestCase):
+    def setUp(self):
+        self.sock = '/tmp/mdv_test_%s.sock' % os.getpid()
+        os.environ['MDV_SOCKET'] = self.sock
+
+    def tearDown(self):
+        os.environ.pop('MDV_SOCKET')
+        if os.path.lexists(self.sock):
+            os.unlink(self.sock)
+
+    def test_not_ours(self):
+        # e.g. planted by another user: a file, a symlink, open to others
+        with open(self.sock, 'w'):
+            pass
+        self.assertFalse(daemon.is_up())
+        os.unlink(self.sock)
+        os.symlink('/dev/null', self.sock)
+        self.assertFalse(daemon.is_up())
+        os.unlink(self.sock)
+        import socket
+
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.bind(self.sock)
+            os.chmod(self.sock, 0o777)
+            self.assertFalse(daemon.is_up())
+            self.assertIsNone(daemon.render({'filename': fn}, (80, 30)))
+            os.chmod(self.sock, 0o700)
+            self.assertTrue(daemon.is_up())
+        finally:
+            s.close()
+
+    def test_serve_refuses(self):
+        with open(self.sock, 'w'):
+            pass
+        env = dict(os.environ, PYTHONPATH=here.rsplit('/', 1)[0])
+        cmd = [sys.executable, '-c', 'import mdv; mdv.run()', '-D']
+        p = subprocess.Popen(cmd, env=env, stderr=subprocess.PIPE)
+        err = p.communicate()[1]
+        self.assertIn(b'not a private socket', err)
+        # left alone:
+        self.assertTrue(os.path.isfile(self.sock))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# coding: utf-8
+import time
+from unittest import TestCase, main
+
+from pygments import token
+
+from mdv.formatter import AnsiFormatter, fast_tokens, highlight
+from mdv import lexers
+
+K, S, C = '<k>', '<s>', '<c>'
+sgr = {token.Keyword: K, token.Literal.String: S}
+
+
+class Colors(dict):
+    def __missing__(self, t):
+        return C
+
+
+class TestFormatter(TestCase):
+    def fmt(self, toks, prefix='> '):
+        from io import StringIO
+
+        buf = StringIO()
+        AnsiFormatter(sgr=Colors(sgr), reset='</>', prefix=prefix).format(toks, buf)
+        return buf.getvalue()
+
+    def test_runs(self):
+        toks = [(token.Keyword, 'if'), (token.Text, ' '), (token.Name, 'x'), (token.Text, '\n')]
+        # same color (C) merged, final newline dropped:
+        self.assertEqual(self.fmt(toks), '> <k>if</><c> x</>')
+
+    def test_lines(self):
+        toks = [(token.Literal.String, '"""a\n\nb"""'), (token.Text, '\n'), (token.Name, 'c\n')]
+        self.assertEqual(
+            self.fmt(toks),
+            '> <s>"""a</>\n> <s></>\n> <s>b"""</><c></>\n> <c>c</>',
+        )
+
+    def test_highlight(self):
+        res = highlight('x = ":-"\n', lexers.get('python'), sgr=Colors(), reset='</>')
+        self.assertEqual(res, '<c>x = ":-"</>')
+
+    def test_fast_tokens(self):
+        code = 'x = "a\\"b" # c\nurl http://x/#y, n=-1.5e3 /* z\n */ v2'
+        toks = list(fast_tokens(code))
+        self.assertEqual(''.join(v for _, v in toks), code)
+        self.assertEqual(
+            [(t, v) for t, v in toks if t is not token.Text],
+            [(token.String, '"a\\"b"'), (token.Comment, '# c'), (token.Number, '-1.5e3'),
+             (token.Comment, '/* z\n */')],
+        )
+        self.assertEqual(self.fmt(fast_tokens("n = 'a'\n")), "> <c>n = </><s>'a'</>")
+
+    def test_fast_tokens_unclosed(self):
+        # each unclosed /* used to rescan the rest: 8000 lines took 10s
+        code = '/* c */ x\n' + 'ls path/*.log  # "q"\n' * 20000
+        t0 = time.time()
+        toks = list(fast_tokens(code))
+        self.assertLess(time.time() - t0, 2)
+        self.assertEqual(''.join(v for _, v in toks), code)
+        self.assertEqual(toks[0], (token.Comment, '/* c */'))
+        self.assertEqual(sum(1 for t, v in toks if t is token.Comment), 20001)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# coding: utf-8
+import os
+from unittest import TestCase, main
+
+from mdv import guess
+
+samples = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'files', 'guess')
+
+
+class TestGuess(TestCase):
+    def test_samples(self):
+        # files named <language>.<nr>:
+        for fn in sorted(os.listdir(samples)):
+            with open(os.path.join(samples, fn)) as fd:
+                code = fd.read()
+            self.assertEqual(guess.guess(code), fn.split('.')[0], fn)
+
+    def test_shebang(self):
+        for line, lang in (
+            ('#!/bin/sh', 'bash'),
+            ('#!/usr/bin/env python3.11', 'python'),
+            ('#!/usr/bin/env -S node --harmony', 'javascript'),
+            ('#!/usr/local/bin/lua5.4', 'lua'),
+        ):
+            self.assertEqual(guess.guess(line + '\nfoo\n'), lang, line)
+
+    def test_no_guess(self):
+        for code in '', 'hello world', 'foo bar\nbaz: qux\n':
+            self.assertIsNone(guess.guess(code), code)
+        # out of time within the first language: none scored, no guess:
+        self.assertEqual(guess.scores('import os\n', 1e-9), {})
+        self.assertEqual(guess.result('import os\n', 1e-9), (None, False))
+        self.assertEqual(guess.result('import os\n'), ('python', True))
+        self.assertEqual(guess.result('#!/bin/sh\nls\n', 1e-9), ('bash', True))
+        # a full size sample is scored well within the budget:
+        code = ('x = foo(bar) if baz else [qux, "quux"]; ' * 3)[:99] + '\n'
+        self.assertEqual(guess.result(code * guess.max_lines)[1], True)
+
+
+if __name__ == '__main__':
+    main()
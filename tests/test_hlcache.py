@@ -0,0 +1,87 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+from unittest import TestCase, main, mock
+
+from mdv import hlcache, markdownviewer as mv
+
+md = '```\npip install mdv\n```\n\n```sh\nmdv README.md\n```\n'
+
+
+class TestHighlightCache(TestCase):
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        # patched, so the suite's own cache (tests/__init__) is back after:
+        env = mock.patch.dict(os.environ, MDV_CACHE_DIR=self.cache)
+        env.start()
+        self.addCleanup(env.stop)
+        hlcache.clear()
+
+    def tearDown(self):
+        hlcache.clear()
+        shutil.rmtree(self.cache)
+
+    def test_render(self):
+        r = mv.Renderer(theme='zenburn', cols=80)
+        first = r.render(md)
+        # 2 blocks, 1 guess:
+        self.assertEqual(hlcache.stats['misses'], 3)
+        self.assertEqual(r.render(md), first)
+        self.assertEqual(hlcache.stats['hits'], 3)
+        # from disk, other colors are other entries:
+        hlcache.clear()
+        self.assertEqual(r.render(md), first)
+        self.assertEqual(hlcache.stats['disk_hits'], 3)
+        other = mv.Renderer(theme='ocean', cols=80).render(md)
+        self.assertNotEqual(other, first)
+        self.assertEqual(hlcache.stats['misses'], 2)
+
+    def test_guess_out_of_time(self):
+        from mdv import guess
+
+        budget, guess.budget = guess.budget, 1e-9
+        try:
+            mv.Renderer(theme='zenburn', cols=80).render(md)
+        finally:
+            guess.budget = budget
+        # in memory only, the next process guesses again:
+        self.assertEqual(hlcache.stats['writes'], 2)
+        hlcache.clear()
+        mv.Renderer(theme='zenburn', cols=80).render(md)
+        self.assertEqual(hlcache.stats['misses'], 1)
+        self.assertEqual(hlcache.stats['writes'], 1)
+
+    def test_hit_imports_no_lexer(self):
+        import subprocess
+        import sys
+
+        code = (
+            'import sys, mdv; mdv.main("```python\\nx = 1\\n```\\n", theme="zenburn", cols=80);'
+            'print("pygments.lexers.python" in sys.modules)'
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ, PYTHONPATH=root, MDV_NO_DAEMON='1')
+        run = lambda: subprocess.check_output([sys.executable, '-c', code], env=env).strip()
+        self.assertEqual(run(), b'True')
+        # cached on disk now:
+        self.assertEqual(run(), b'False')
+
+    def test_limits(self):
+        mins = hlcache.mem_max, hlcache.disk_max_bytes
+        hlcache.mem_max, hlcache.disk_max_bytes = 2, 1000
+        try:
+            for i in range(20):
+                hlcache.put(hlcache.key(str(i)), 'x' * 100)
+            self.assertEqual(len(hlcache.mem), 2)
+            hlcache.trim(force=True)
+            d = os.path.join(self.cache, 'hl')
+            size = sum(os.path.getsize(os.path.join(p, f)) for p, _, fs in os.walk(d) for f in fs)
+            self.assertLessEqual(size, 800)
+            self.assertEqual(hlcache.get(hlcache.key('19')), 'x' * 100)
+        finally:
+            hlcache.mem_max, hlcache.disk_max_bytes = mins
+
+
+if __name__ == '__main__':
+    main()
@@ -39,6 +39,32 @@ class TestInlines(TestCase):
 '''
         )
 
+    def test_markup(self):
+        st = 'x `a` **b *c* [l](http://u)** ![i](p.png) d  \ne'
+        s = mdv.main(st, theme='zenburn', cols=80, keep_bg=True)
+        self.assertEqual(
+            clean(s), 'x a b c l①  <img src="p.png" alt="i" /> d\n  e\n  [1] http://u'
+        )
+
+    def test_link_in_nested_list(self):
+        st = '- [a](#a)\n    - [b](#b)\n'
+        s = mdv.main(st, theme='zenburn', cols=80, keep_bg=True, link_style='i')
+        self.assertEqual(clean(s), '- a(#a)\n        - b(#b)')
+
+
+    def test_marker_nesting(self):
+        r = mdv.Renderer(theme='zenburn', cols=80, keep_bg=True)
+        t, h2, h3 = r.sgr(r.T), r.sgr(r.H2), r.sgr(r.H3)
+        s = r.render('a [b *c* d](#x) e')
+        # end of em restores the link's style, not the outer one:
+        self.assertIn('a ' + h2 + '\x1b[4mb ' + h3 + 'c' + t + h2 + '\x1b[4m d\x1b[24m' + t, s)
+        self.assertEqual(r.col('x', r.T), t + 'x' + r.reset_col)
+
+    def test_col_without_theme(self):
+        # errors before any theme is loaded (bad cli args):
+        r = mdv.Renderer(theme=False)
+        self.assertIn('ERR', r.col('ERR', (1, 255, 124)))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,74 @@
+# coding: utf-8
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, main, mock
+
+from mdv import lexers
+
+
+class TestLexerIndex(TestCase):
+    def setUp(self):
+        self.cache = tempfile.mkdtemp()
+        # patched, so the suite's own cache (tests/__init__) is back after:
+        env = mock.patch.dict(os.environ, MDV_CACHE_DIR=self.cache)
+        env.start()
+        self.addCleanup(env.stop)
+        lexers.aliases = None
+        lexers.instances.clear()
+
+    def tearDown(self):
+        lexers.aliases = None
+        lexers.instances.clear()
+        shutil.rmtree(self.cache)
+
+    def test_names(self):
+        for name, lexer in (
+            ('language-python', 'PythonLexer'),
+            ('sh', 'BashLexer'),
+            ('js', 'JavascriptLexer'),
+            ('md', 'MarkdownLexer'),
+            ('markdown', 'MarkdownLexer'),
+            ('yml', 'YamlLexer'),
+        ):
+            self.assertEqual(type(lexers.get(name)).__name__, lexer)
+        self.assertIsNone(lexers.get('no-such-language'))
+        # instances are reused:
+        self.assertIs(lexers.get('sh'), lexers.get('sh'))
+
+    def test_filenames(self):
+        for fn, name in (
+            ('foo.py', 'python'),
+            ('/a/b/Makefile', 'make'),
+            ('x.sql', 'sql'),
+            ('x.H', 'c'),
+        ):
+            self.assertEqual(lexers.for_filename(fn), name)
+        self.assertIsNone(lexers.for_filename('README'))
+        self.assertIsNone(lexers.for_filename('x.no-such-ext'))
+
+    def test_pack(self):
+        lexers.load()
+        fn = lexers.pack_file()
+        with open(fn) as fd:
+            pack = json.load(fd)
+        self.assertIn('python', pack['aliases'])
+        # other pygments version: rebuilt
+        pack['pygments'], pack['aliases'] = '0.0', {}
+        with open(fn, 'w') as fd:
+            json.dump(pack, fd)
+        lexers.aliases = None
+        self.assertIn('python', lexers.load())
+        # a distribution (maybe with plugin lexers) installed since: rebuilt
+        with open(fn) as fd:
+            pack = json.load(fd)
+        pack['installed'], pack['aliases'] = [['/x/site-packages', 1.0]], {}
+        with open(fn, 'w') as fd:
+            json.dump(pack, fd)
+        lexers.aliases = None
+        self.assertIn('python', lexers.load())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+# coding: utf-8
+import os
+import re
+import threading
+from unittest import TestCase, main
+
+from pygments import token
+
+from mdv import hlcache, markdownviewer as mv
+
+here = os.path.dirname(os.path.abspath(__file__))
+settings = [
+    dict(theme='729.8953', cols=40, c_no_guess=True, keep_bg=True),
+    dict(theme='zenburn', cols=80, link_style='i', header_nrs='1-'),
+    dict(theme='ocean', cols=120, link_style='h', c_def_lexer='md'),
+]
+
+
+def docs():
+    d = os.path.join(here, 'files')
+    return [mv.readfile(os.path.join(d, f)) for f in sorted(os.listdir(d)) if f.endswith('.md')]
+
+
+class TestRenderer(TestCase):
+    def test_reuse(self):
+        r = mv.Renderer(**settings[1])
+        md = '# a\n## b\n\n!!! foo: unknown admon\n\n[x](http://x)'
+        first = r.render(md)
+        self.assertEqual(r.render(md), first)
+        # same as a main call, and no global state leaks into the next:
+        self.assertEqual(mv.main(md, **settings[1]), first)
+        self.assertNotIn('foo', mv.admons)
+        self.assertEqual(mv.header_nr, {'from': 0, 'to': 0})
+        self.assertEqual(mv.show_links, 'it')
+
+    def test_threads(self):
+        rs = [mv.Renderer(**kw) for kw in settings]
+        mds = docs()
+        serial = [[r.render(md) for md in mds] for r in rs]
+        res, errs = {}, []
+
+        def work(i, r):
+            try:
+                for k in range(3):
+                    res[i, k] = [r.render(md) for md in mds]
+            except Exception as ex:  # pragma: no cover
+                errs.append(ex)
+
+        # two threads per renderer, renderers shared:
+        ts = [threading.Thread(target=work, args=(i, rs[i % 3])) for i in range(6)]
+        [t.start() for t in ts]
+        [t.join() for t in ts]
+        self.assertEqual(errs, [])
+        for (i, k), v in res.items():
+            self.assertEqual(v, serial[i % 3])
+
+    def test_pool(self):
+        blocks = ['```%s\nx = %s\n```' % (l, i) for i, l in enumerate(['python', 'js', '', 'sh'] * 3)]
+        md = '\n\n'.join(blocks + ['    indented = 1', '> quoted:\n>\n>     x = 1\n>     y = 2'])
+        r = mv.Renderer(**settings[1])
+        mins = mv.hl_pool_size, mv.hl_pool_min_cpus, mv.hl_pool_min_blocks, hlcache.disk_max_bytes
+        hlcache.disk_max_bytes = 0
+        pooled, parallel = [], mv.highlight_parallel
+
+        def counted(colors, jobs):
+            # the workers get code, lexer name and prefix - no renderer:
+            self.assertEqual(colors, r.code_colors())
+            pooled.extend(jobs)
+            return parallel(colors, jobs)
+
+        mv.highlight_parallel = counted
+        try:
+            hlcache.clear()
+            serial = r.render(md)
+            self.assertEqual(pooled, [])
+            hlcache.clear()
+            mv.hl_pool_size, mv.hl_pool_min_cpus, mv.hl_pool_min_blocks = 2, 1, 5
+            self.assertEqual(r.render(md), serial)
+            # the fenced ones:
+            self.assertEqual(len(pooled), 12)
+            self.assertEqual(sorted(set(type(n) for c, n, p in pooled)), [str])
+        finally:
+            mv.highlight_parallel = parallel
+            mv.hl_pool_size, mv.hl_pool_min_cpus, mv.hl_pool_min_blocks, hlcache.disk_max_bytes = mins
+
+    def test_code_colors(self):
+        r = mv.Renderer(theme='zenburn', cols=80, c_no_guess=True)
+        # subtypes get the color of their nearest configured type:
+        self.assertEqual(r.token_sgr(token.Keyword.Namespace), r.sgr(r.CH3))
+        self.assertEqual(r.token_sgr(token.Literal.String.Double), r.sgr(r.CH4))
+        self.assertEqual(r.token_sgr(token.Text), r.sgr(r.C))
+        # c_theme: other code colors, same text colors:
+        md = '# a\n\n```python\nimport os\n```\n'
+        o = mv.Renderer(theme='zenburn', c_theme='ocean', cols=80, c_no_guess=True)
+        self.assertNotEqual(o.render(md), r.render(md))
+        self.assertEqual(o.render(md).split(r.code_pref)[0], r.render(md).split(r.code_pref)[0])
+
+    def test_large_code(self):
+        r = mv.Renderer(theme='zenburn', cols=80, c_no_guess=True)
+        md = '```python\n%s\n```\n' % '\n'.join('import os  # %s' % i for i in range(20))
+        lexed = r.render(md)
+        r.large_code_lines = 10
+        fast = r.render(md, theme_info=True)
+        self.assertNotEqual(fast, lexed)
+        # comments colored, but no keywords:
+        self.assertIn(r.token_sgr(token.Comment), fast)
+        self.assertNotIn(r.token_sgr(token.Keyword.Namespace), fast)
+        self.assertIn('fast highlighted: 1', fast)
+        r.large_code_hl = 'plain'
+        plain = r.render(md)
+        self.assertIn(r.token_sgr(token.Text) + 'import os  # 3' + r.reset_col, plain)
+        self.assertEqual(mv.clean_ansi(plain), mv.clean_ansi(lexed))
+        # fast, but over large_code_fast_chars: plain as well
+        r.large_code_hl, r.large_code_fast_chars = 'fast', 100
+        self.assertEqual(r.render(md), plain)
+
+    def test_deferred(self):
+        import io
+
+        r = mv.Renderer(**settings[1])
+        md = '# a\n\n```python\nimport os\nx = 1\n```\n\ntext\n\n    y = 2\n'
+        full, jobs = r.render(md), []
+        printed = r.render(md, defer_code=jobs)
+        self.assertEqual(len(jobs), 2)
+        hl = [(plain, f()) for plain, f in jobs]
+        self.assertNotIn(hl[0][1], printed)
+        for plain, code in hl:
+            printed = printed.replace(plain, code)
+        self.assertEqual(printed, full)
+        # repainting: the block's lines, counted from the bottom
+        out, printed = io.StringIO(), r.render(md, defer_code=[]) + '\n'
+        job = [j for j in jobs if 'import os' in j[0]]
+        p = mv.Repainter(printed, job, out=out, size=(80, 50))
+        p.run()
+        lines = printed.split('\n')
+        up = len(lines) - 1 - next(i for i, l in enumerate(lines) if 'import os' in l)
+        first = job[0][1]().split('\n')[0]
+        # with the colors in effect there:
+        self.assertIn('\x1b7\x1b[%sA\r%s%s\x1b8' % (up, p.sgr_at(printed.find(job[0][0])), first), out.getvalue())
+        # the terminal's size, not the render's: narrower, the lines wrap,
+        # i.e. are further up. Scrolled out of a short one, not repainted:
+        out = io.StringIO()
+        mv.Repainter(printed, job, out=out, size=(10, 50)).run()
+        self.assertGreater(int(re.search(r'\x1b\[(\d+)A', out.getvalue()).group(1)), up)
+        out = io.StringIO()
+        mv.Repainter(printed, job, out=out, size=(80, up - 1)).run()
+        self.assertEqual(out.getvalue(), '')
+
+    def test_source_mode(self):
+        src = '"""_\n# Mod\n\n```sh\nls\n```\n"""\nimport os\n\n\ndef f(a):\n    """_\n    - *f*\n    """\n    return a < 1  # ```\n'
+        r = mv.Renderer(**settings[1])
+        # blank lines after the last docstring are a code block:
+        for s in src, src + '"""_\nend\n"""\n\n\n':
+            for what in 'all', 'code', 'doc', 'mod':
+                # the code regions stashed, not fenced, same result:
+                fenced = mv.do_code_hilite(s, what, 'python')
+                self.assertEqual(r.render(s, code_hilite=what, filename='m.py'), r.render(fenced), what)
+        self.assertEqual(mv.do_code_hilite(src, 'doc'), '# Mod\n\n```sh\nls\n```')
+        self.assertEqual(r.source_lang(src), 'python')
+
+    def test_explain_slow(self):
+        md = '# T\n\ntext\n\n| aaaa | bbbb |\n|---|---|\n| 1 | 2 |\n\n- x\n    - y\n\n```\nimport os\n```\n'
+        r = mv.Renderer(theme='zenburn', cols=5)
+        self.assertEqual(r.render(md, explain_slow=2), r.render(md))
+        r.render(md, explain_slow=2)
+        costs = r.local.costs
+        self.assertEqual([c['kind'] for c in costs], ['h1', 'p', 'table', 'ul, depth 2', 'code'])
+        self.assertEqual([c['lines'] for c in costs], [(1, 1), (3, 3), (5, 7), (9, 10), (12, 14)])
+        self.assertIn('split_blocks', ' '.join(costs[2]['notes']))
+        self.assertTrue(costs[4]['notes'])
+        # one time imports on their own, not the first code block's:
+        self.assertIn('pygments', ' '.join(r.local.setup_cost['notes']))
+        # cleared by the next render, html too:
+        r.render(md, do_html=True)
+        self.assertIsNone(r.local.costs)
+        self.assertEqual(len(costs), 5)
+
+    def test_explain_slow_cli(self):
+        import subprocess
+        import sys
+
+        cmd = [sys.executable, '-c', 'import mdv; mdv.run()', '-E', 'x', os.path.join(here, 'files', 'test1.md')]
+        p = subprocess.run(cmd, capture_output=True, cwd=os.path.dirname(here))
+        self.assertEqual(p.returncode, 1)
+        self.assertIn(b'not a number', p.stderr)
+        self.assertNotIn(b'Traceback', p.stderr)
+
+
+if __name__ == '__main__':
+    main()
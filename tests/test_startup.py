@@ -0,0 +1,54 @@
+# coding: utf-8
+"""
+Startup cost of mdv: It is run from shell prompts and git hooks, so the
+import must stay cheap. Budget (ms) can be adapted via $MDV_IMPORT_BUDGET_MS.
+"""
+import os
+import subprocess
+import sys
+from unittest import TestCase, main
+
+import mdv
+
+here = os.path.abspath(__file__).rsplit('/', 1)[0]
+budget_ms = float(os.environ.get('MDV_IMPORT_BUDGET_MS', 100))
+
+probe = '''
+import sys, time
+t0 = time.time()
+import mdv
+dt = time.time() - t0
+heavy = %r
+heavy = [m for m in sys.modules
+         if any(m == h or m.startswith(h + '.') for h in heavy)]
+print('%%s %%s' %% (dt * 1000, ','.join(heavy)))
+''' % (('markdown', 'pygments', 'xml', 'logging', 'mdv.tabulate'),)
+
+
+def import_time():
+    """returns (best time in ms, list of heavy modules imported)"""
+    env = dict(os.environ, PYTHONPATH=here.rsplit('/', 1)[0])
+    res = []
+    for i in range(3):
+        out = subprocess.check_output([sys.executable, '-c', probe], env=env)
+        dt, heavy = (out.decode('utf-8').strip() + ' ').split(' ', 1)
+        res.append((float(dt), heavy.split()))
+    return min(res)
+
+
+class TestStartup(TestCase):
+    def test_no_heavy_imports(self):
+        self.assertEqual(import_time()[1], [])
+
+    def test_import_budget(self):
+        dt = import_time()[0]
+        print('import mdv: %.1fms (budget %sms)' % (dt, budget_ms))
+        self.assertLess(dt, budget_ms)
+
+    def test_cli_opts_in_sync_with_doc(self):
+        mv = mdv.markdownviewer
+        self.assertEqual(mv.cli_opts, mv.parse_doc_opts())
+
+
+if __name__ == '__main__':
+    main()
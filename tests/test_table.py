@@ -0,0 +1,44 @@
+# coding: utf-8
+from unittest import TestCase, main
+
+import mdv
+from mdv import table
+from mdv.tabulate import tabulate
+
+red, R = '\x1b[31m', '\x1b[0m'
+
+
+class TestTable(TestCase):
+    def test_like_tabulate(self):
+        rows = [['Item', 'Value', 'Note'], [red + 'Computer' + R, '$1600', ' a\nb '], ['jp', '', 'x']]
+        widths, lines = table.layout(rows)
+        self.assertEqual(widths, [8, 5, 4])
+        self.assertEqual('\n'.join(lines), tabulate(rows).replace('-', '─'))
+        # wide chars by their columns (tabulate pads them by len):
+        rows[2][0] = '日本'
+        self.assertEqual(table.layout(rows)[1][3], '日本             x')
+
+    def test_aligns(self):
+        widths, lines = table.layout([['a', 'b', 'c'], ['xxxx', 'yyyy', 'zzzz']], ['center', 'right'])
+        self.assertEqual(lines[1], ' a       b  c')
+
+    def test_markdown_aligns(self):
+        md = '| a | b | c |\n|:-:|--:|---|\n| 1111 | 2222 | 3333 |\n'
+        s = mdv.markdownviewer.clean_ansi(mdv.main(md, theme='zenburn', cols=80))
+        self.assertIn('   a       b  c\n', s)
+
+    def test_split(self):
+        r = mdv.Renderer(theme='zenburn', cols=14)
+        widths, lines = table.layout([['aaaa', 'bbbb', 'cccc'], [red + 'x' + R, 'yy', 'averyverylongcell']])
+        parts = r.split_blocks(lines, widths, 14).strip('\n').split('\n')
+        clean = [mdv.markdownviewer.clean_ansi(l) for l in parts]
+        # at column boundaries, the too wide one cut:
+        self.assertEqual(clean[:4], ['────  ────', 'aaaa  bbbb', 'x     yy  ', '────  ────'])
+        self.assertEqual(clean[5:7], [' ✂cccc', ' ✂averyverylon'])
+        self.assertEqual(clean[9:11], [' ✂', ' ✂gcell'])
+        # colors kept:
+        self.assertTrue(parts[2].startswith(red + 'x' + R))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# coding: utf-8
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase, main, mock
+
+from mdv import themes
+
+
+class TestThemePack(TestCase):
+    def setUp(self):
+        self.src = tempfile.mkdtemp()
+        self.cache = tempfile.mkdtemp()
+        # patched, so the suite's own cache (tests/__init__) is back after:
+        env = mock.patch.dict(os.environ, MDV_CACHE_DIR=self.cache)
+        env.start()
+        self.addCleanup(env.stop)
+        for d in themes.theme_dirs:
+            os.mkdir(os.path.join(self.src, d))
+        self.write('b16', 'foo', {'scheme': 'Foo', 'base00': '3f3f3f'})
+        self.write('5color', 'foo', {'scheme': 'Foo5', 'base00': 12})
+        self.write('5color', '1.2', {'scheme': 'Bar', 'base00': False})
+
+    def tearDown(self):
+        themes.packs.pop(self.src, 0)
+        shutil.rmtree(self.src)
+        shutil.rmtree(self.cache)
+
+    def write(self, d, n, spec):
+        with open(os.path.join(self.src, d, n + '.json'), 'w') as fd:
+            fd.write(json.dumps(spec))
+
+    def test_index(self):
+        pack = themes.load(self.src)
+        # b16 has precedence, hex is resolved:
+        self.assertEqual(tuple(pack['index']['foo']['base00']), (63, 63, 63))
+        self.assertEqual(pack['index']['1.2']['base00'], False)
+        self.assertEqual(list(pack['dirs']['5color']), ['1.2', 'foo'])
+        self.assertTrue(os.path.exists(themes.pack_file(self.src)))
+
+    def test_rebuild_when_dir_newer(self):
+        themes.load(self.src)
+        themes.packs.pop(self.src)
+        fn = themes.pack_file(self.src)
+        # make the pack look old:
+        os.utime(fn, (time.time() - 100,) * 2)
+        self.write('b16', 'new', {'scheme': 'New', 'base00': '000000'})
+        self.assertIn('new', themes.load(self.src)['index'])
+
+    def test_rebuild_when_file_edited(self):
+        themes.load(self.src)
+        themes.packs.pop(self.src)
+        fn = themes.pack_file(self.src)
+        os.utime(fn, (time.time() - 100,) * 2)
+        for d in themes.theme_dirs:
+            os.utime(os.path.join(self.src, d), (time.time() - 200,) * 2)
+        # in place, the dir's mtime stays:
+        p = os.path.join(self.src, 'b16', 'foo.json')
+        with open(p, 'w') as fd:
+            fd.write(json.dumps({'scheme': 'Foo', 'base00': '000000'}))
+        os.utime(os.path.join(self.src, 'b16'), (time.time() - 200,) * 2)
+        self.assertEqual(tuple(themes.load(self.src)['index']['foo']['base00']), (0, 0, 0))
+
+    def test_shipped_themes(self):
+        spec = themes.get('zenburn')
+        self.assertEqual(spec['base00'], (56, 56, 56))
+        self.assertIn('729.8953', themes.names('5color'))
+
+
+if __name__ == '__main__':
+    main()
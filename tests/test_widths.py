@@ -0,0 +1,56 @@
+# coding: utf-8
+import random
+import re
+from unittest import TestCase, main
+
+import mdv
+from mdv import ansi, wrap
+from mdv.widths import clip, columns
+
+red, R = '\x1b[31m', '\x1b[0m'
+em, em_end = mdv.markdownviewer.emph_start, mdv.markdownviewer.emph_end
+inv, closing = mdv.markdownviewer.invisible_markers, ''.join(mdv.markdownviewer.marker_ends)
+drop = dict.fromkeys(map(ord, inv))
+
+
+class TestWidths(TestCase):
+    def test_columns(self):
+        self.assertEqual(columns('abc'), 3)
+        self.assertEqual(columns('äöü①─'), 5)
+        self.assertEqual(columns('日本語'), 6)
+        self.assertEqual(columns('👍 ok'), 5)
+        # combining accent:
+        self.assertEqual(columns('é'), 1)
+        self.assertEqual(ansi.width(red + '日本' + R), 4)
+
+    def test_clip(self):
+        self.assertEqual(clip('a日本b', 1, 5), '日本')
+        # wide chars cut by a boundary are spaces:
+        self.assertEqual(clip('a日本b', 0, 2), 'a ')
+        self.assertEqual(clip('a日本b', 2), ' 本b')
+        self.assertEqual(ansi.slice(red + '日本' + R + 'x', 2), red + '本' + R + 'x')
+
+    def test_layout(self):
+        lines = wrap.fill('日本語 日本語 日本語 日本語', 14).split('\n')
+        self.assertEqual(lines, ['日本語 日本語', '日本語 日本語'])
+        # a long word, never overflowing:
+        self.assertEqual(wrap.fill('日本語日本語', 5), '日本\n語日\n本語')
+
+    def test_wrap_never_overflows(self):
+        rnd = random.Random(5)
+        words = ['上面', 'b', '世界世界世界', 'ab', '日本語日本語x', 'x-y', '👍', em + 'ok' + em_end]
+        for i in range(2000):
+            t = ' '.join(rnd.choice(words) for j in range(rnd.randint(1, 12)))
+            width = rnd.randint(2, 20)
+            for line in wrap.fill(t, width, inv, closing).split('\n'):
+                self.assertLessEqual(ansi.width(line.translate(drop)), width, (t, width))
+        md = '上面 b 世界 ' * 20
+        for cols in 10, 18, 38:
+            s = mdv.main(md, cols=cols, theme='zenburn', keep_bg=True)
+            # (after add_bg_reset's background lines and cursor up)
+            s = re.split(r'\x1b\[\d+A', s)[-1]
+            self.assertLessEqual(max(ansi.width(l) for l in s.split('\n')), cols)
+
+
+if __name__ == '__main__':
+    main()
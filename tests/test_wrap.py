@@ -0,0 +1,42 @@
+# coding: utf-8
+import random
+import textwrap
+from unittest import TestCase, main
+
+from mdv import markdownviewer as mdv
+from mdv import wrap
+
+R, red = '\x1b[0m', '\x1b[31m'
+em, em_end = mdv.emph_start, mdv.emph_end
+inv, closing = mdv.invisible_markers, ''.join(mdv.marker_ends)
+
+
+class TestWrap(TestCase):
+    def test_like_textwrap(self):
+        rnd = random.Random(1)
+        words = ['a', 'bb', 'ccc-dd', 'e-f-g', 'long-hyphenated-word', 'x' * 25, '--', '  ', '\t']
+        for i in range(500):
+            t = ' '.join(rnd.choice(words) for j in range(rnd.randint(0, 30)))
+            w = rnd.randint(1, 30)
+            self.assertEqual(wrap.fill(t, w), textwrap.fill(textwrap.dedent(t).strip(), w), (t, w))
+
+    def test_zero_width(self):
+        t = ' '.join(em + 'word' + em_end for i in range(10))
+        lines = wrap.fill(t, 20, inv, closing).split('\n')
+        # 4 words per line, as without the markers:
+        self.assertEqual([l.count('word') for l in lines], [4, 4, 2])
+        t = ' '.join(red + 'word' + R for i in range(10))
+        self.assertEqual(wrap.fill(t, 20).count('\n'), 2)
+
+    def test_long_word(self):
+        t = em + 'abcdefghij' + em_end + 'klm ' + red + 'xyz' + R
+        lines = wrap.fill(t, 10, inv, closing).split('\n')
+        # the end marker stays with its word:
+        self.assertEqual(lines[0], em + 'abcdefghij' + em_end)
+        self.assertEqual(lines[1], 'klm ' + red + 'xyz' + R)
+        # never within an escape sequence:
+        self.assertEqual(wrap.fill(red + 'abcdef' + R, 3), red + 'abc\ndef' + R)
+
+
+if __name__ == '__main__':
+    main()